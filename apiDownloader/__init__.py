@@ -2,101 +2,571 @@ import os
 import re
 import requests
 import logging
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
+
+from urllib3.exceptions import ProtocolError
+
+from . import events
+from .bandwidth import BandwidthScheduler
+from .dedup import ContentStore
+from .diskio import FolderCache, WriterPool
+from .events import DownloadEvent, EventBus
+from .extract import JsonExtractor, dvach_json_url, get_extractor
+from .httpcache import CachedPage, PageCache, compressor
+from .jobs import JobQueue
+from .manifest import Manifest, verify_manifests
+from .metrics import Metrics, Span, host_of
+from .postprocess import MediaIndex, PostProcessor
+from .ratelimit import HostLimiter, HostLimits, RetryPolicy, TokenBucket, describe_status
+from .storage import (DEFAULT_CHUNK_SIZE, PART_SUFFIX, FileSink, IncompleteDownload, RangeNotSatisfiable,
+                      copy_response)
+
+__all__ = [
+    "ARCHIVACH", "DVACH", "IMAGE_EXT", "MEDIA_EXT", "VIDEO_EXT",
+    "ArhivachIndex", "AsyncDownloader", "BandwidthScheduler", "CachedPage", "ContentStore", "DownloadEvent",
+    "DownloadStopped", "Downloader", "DvachCatalog", "EventBus", "FairQueue", "FileSink", "HostLimiter",
+    "HostLimits", "IncompleteDownload", "JobQueue", "Manifest", "MediaIndex", "Metrics", "PageCache",
+    "PostProcessor", "RangeNotSatisfiable", "RetryPolicy", "Scheduler", "Span", "ThreadWatcher", "TokenBucket",
+    "VisitedIndex", "build_file_url", "crawl_jobs", "events", "find_media_links", "host_type_for", "media_folder",
+    "verify_manifests", "watch_threads",
+]
 
 FOLDER_NAME_FROM_LINK_PATTERN = r"/(\d+)(\.html)?(#.*)?/?$"
 DVACH = "https://2ch.hk"
 ARCHIVACH = "https://arhivach.top"
 IMAGE_EXT = [".jpg", ".png", ".gif"]
 VIDEO_EXT = [".mp4", ".webm"]
+MEDIA_EXT = tuple(IMAGE_EXT + VIDEO_EXT)
+CONTENT_HASH = "sha256"
+PAGE_CHUNK_SIZE = 64 * 1024
+
+
+def find_media_links(content, extractor="auto"):
+    return get_extractor(extractor, MEDIA_EXT).extract(content)
+
+
+def build_file_url(link_href, host_type):
+    if host_type == "2ch":
+        return DVACH + link_href
+    elif host_type == "arhivach":
+        if any(extension in link_href for extension in IMAGE_EXT):
+            return ARCHIVACH + link_href
+        elif any(extension in link_href for extension in VIDEO_EXT):
+            return link_href
+    return link_href
+
+
+def media_folder(output_path, link_href):
+    if link_href.endswith(tuple(IMAGE_EXT)):
+        return os.path.join(output_path, 'images')
+    elif link_href.endswith(tuple(VIDEO_EXT)):
+        return os.path.join(output_path, 'videos')
+    return output_path
+
+
+def host_type_for(url):
+    if "2ch" in url:
+        return "2ch"
+    elif "arhivach" in url:
+        return "arhivach"
+    return None
+
+
+class DownloadStopped(Exception):
+    """Raised inside a file download after `Downloader.stop()`; the part stays resumable."""
+
 
 class Downloader:
-    def __init__(self, urls, output_path, max_workers=5, log_level=logging.INFO, log_file=None):
+    def __init__(self, urls, output_path, max_workers=5, log_level=logging.INFO, log_file=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, retries=2, content_store=None, extractor="auto",
+                 use_json_api=True, page_workers=4, priority="images_first", rate_limit=None, burst=None,
+                 adaptive_concurrency=True, max_per_host=None, retry_policy=None, listeners=None,
+                 job_queue=None, metrics=None, writers=2, fsync="never", preallocate=False, manifest=True,
+                 page_cache=None, bandwidth=None, postprocess=None, timeout=60, connect_timeout=10):
         self.urls = urls
         self.output_path = output_path
         self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.content_store = content_store
+        self.page_cache = page_cache
+        self.bandwidth = bandwidth
+        self.postprocess = postprocess
+        # seconds to connect and between two reads; a stalled server would otherwise hold a worker forever
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.extractor = extractor
+        self.use_json_api = use_json_api
+        self.page_workers = page_workers
+        self.priority = priority
+        self.job_queue = job_queue
+        self.writers = writers
+        self.fsync = fsync
+        self.preallocate = preallocate
+        self.manifest = manifest
+        self.manifests = {}
+        self._manifests_lock = threading.Lock()
+        self.folders = FolderCache()
+        # filenames being downloaded right now, so two links to one file never share a .part
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.writer = WriterPool(writers or 1, chunk_size, fsync=fsync)
+        self.retry_policy = retry_policy or RetryPolicy(retries)
+        self.host_limits = HostLimits(
+            rate=rate_limit,
+            burst=burst,
+            adaptive=adaptive_concurrency,
+            max_concurrency=max_per_host or max_workers,
+        )
         self.log_level = log_level
         self.log_file = log_file
         self.logger = self._configure_logging()
+        self.events = EventBus(self.logger)
+        self.metrics = metrics or Metrics()
+        self.metrics.add_collector(self._collect_host_limits)
+        self.events.subscribe(self.metrics.on_event)
+        if bandwidth is not None:
+            self.events.subscribe(bandwidth.on_event)
+        if postprocess is not None:
+            postprocess.logger = postprocess.logger or self.logger
+            self.events.subscribe(postprocess.on_event)
+        for listener in listeners or []:
+            self.events.subscribe(listener)
+
+    def stop(self):
+        """Stop a running download from another thread.
+
+        Queued files are dropped and files in flight are interrupted at their
+        next chunk, keeping their `.part` for the next run.
+        """
+        self.stopped.set()
+
+    @property
+    def request_timeout(self):
+        return self.connect_timeout, self.timeout
+
+    def subscribe(self, callback):
+        return self.events.subscribe(callback)
 
     def _configure_logging(self):
         logger = logging.getLogger(__name__)
         logger.setLevel(self.log_level)
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         if self.log_file:
-            file_handler = logging.FileHandler(self.log_file)
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            # the logger is shared by every Downloader, so keep a single handler per log file
+            path = os.path.abspath(self.log_file)
+            if not any(isinstance(handler, logging.FileHandler) and handler.baseFilename == path
+                       for handler in logger.handlers):
+                file_handler = logging.FileHandler(self.log_file)
+                file_handler.setFormatter(formatter)
+                logger.addHandler(file_handler)
         return logger
 
+    def _collect_host_limits(self):
+        for host, state in self.host_limits.snapshot().items():
+            self.metrics.host_limit.set(state["limit"], host=host)
+            self.metrics.host_in_flight.set(state["in_flight"], host=host)
+
+    def _job_for(self, url, host_type=None):
+        match = re.search(FOLDER_NAME_FROM_LINK_PATTERN, url)
+        if not match:
+            self.logger.error(f"Incorrect link: {url}. Skipping it.")
+            return None
+        host_type = host_type or host_type_for(url)
+        if not host_type:
+            self.logger.error(f"Unsupported host: {url}. Skipping it.")
+            return None
+        return url, self.output_path + match.group(1), host_type
+
+    def _thread_jobs(self):
+        jobs = [self._job_for(url) for url in dict.fromkeys(self.urls)]
+        return [job for job in jobs if job]
+
     def start_download(self):
-        links_and_folder_names = {}
-        for link in self.urls:
-            match = re.search(FOLDER_NAME_FROM_LINK_PATTERN, link)
-            if match:
-                links_and_folder_names[link] = match.group(1)
-            else:
-                self.logger.error(f"Incorrect link: {link}")
-                return
+        threads = self._thread_jobs()
+        if self.job_queue is not None:
+            self.job_queue.add_all(threads)
+            threads = self.job_queue.unfinished()
+        Scheduler(self, self.page_workers, self.priority, self.job_queue).run(threads)
 
-        for k, v in links_and_folder_names.items():
-            if "2ch" in k:
-                self.download_from_host(self.output_path + v, "2ch", k)
-            elif "arhivach" in k:
-                self.download_from_host(self.output_path + v, "arhivach", k)
+    def crawl(self, crawlers, visited=None):
+        """Download every thread found by `crawlers` (see `apiDownloader.crawl`).
 
-    def download_from_host(self, output_path, host_type, url):
+        Threads already recorded in the `visited` index are skipped, and new
+        ones are downloaded while later listing pages are still being read.
+        A thread is recorded as visited once it is saved in the job queue,
+        or without one once it has finished downloading.
+        """
+        found = {}
+        jobs = crawl_jobs(self, crawlers, visited, found)
+        mark_visited = None
+        if self.job_queue is not None:
+            jobs = self._queued(jobs, found, visited)
+        elif visited is not None:
+            mark_visited = self.events.subscribe(self._visited_on_done(found, visited))
         try:
-            response = requests.get(url)
+            Scheduler(self, self.page_workers, self.priority, self.job_queue).run(jobs)
+        finally:
+            if mark_visited is not None:
+                self.events.unsubscribe(mark_visited)
+
+    @staticmethod
+    def _visited_on_done(found, visited):
+        def on_thread_done(event):
+            # a thread with failed files stays unvisited, so the next crawl tries it again
+            if event.kind == events.THREAD_DONE and event.thread_url in found:
+                thread = found.pop(event.thread_url)
+                if not event.failed:
+                    visited.add(thread)
+        return on_thread_done
+
+    def _queued(self, jobs, found=None, visited=None):
+        for job in jobs:
+            self.job_queue.add_all([job], reopen=False)
+            if visited is not None:
+                visited.add(found.pop(job[0]))
+            yield job
+
+    def verify(self, processes=None):
+        """Re-hash the files recorded in the manifests of `urls` and download the broken ones again.
+
+        Hashing runs on `processes` worker processes (all cores by default).
+        Files that are missing, truncated or changed are deleted and
+        re-queued straight from their manifest entries, without fetching
+        the thread page. Files adopted from disk without a download first
+        get their size compared with the server's Content-Length. Returns
+        `{thread_url: [link, ...]}` of the files that failed.
+        """
+        if not self.manifest:
+            raise ValueError("verify() needs the downloader to keep manifests")
+        threads = {job: self._manifest_for(job[1]) for job in self._thread_jobs()}
+        self._check_unverified(threads.values())
+        failed = verify_manifests(list(threads.values()), CONTENT_HASH, processes)
+        links = {}
+        for job, manifest in threads.items():
+            entries = failed.get(manifest)
+            if not entries:
+                continue
+            self.logger.warning(f"{len(entries)} file(s) from {job[0]} failed verification, downloading them again.")
+            for entry in entries:
+                self.folders.discard(manifest.filename_for(entry["name"]))
+                if self.content_store is not None and entry.get("hash"):
+                    self.content_store.discard(entry["hash"])
+            links[job[0]] = ([entry["link"] for entry in entries],
+                             {entry["link"]: entry["size"] for entry in entries if entry.get("size")})
+        if links:
+            requeue = [job for job in threads if job[0] in links]
+            Scheduler(self, self.page_workers, self.priority, self.job_queue, links).run(requeue)
+        return {url: thread_links for url, (thread_links, _) in links.items()}
+
+    def _check_unverified(self, manifests):
+        entries = [(manifest, entry) for manifest in manifests for entry in list(manifest.entries.values())
+                   if entry.get("unverified")]
+        if not entries:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            sizes = pool.map(lambda item: self._remote_size(item[1]["url"]), entries)
+            for (manifest, entry), size in zip(entries, sizes):
+                if size is None:
+                    continue
+                # with the server's size recorded a truncated file fails the check and is downloaded again
+                manifest.record(manifest.filename_for(entry["name"]), entry["url"], entry.get("link"), size,
+                                entry.get("hash"), entry.get("etag"))
+
+    def _remote_size(self, url):
+        def head(lease):
+            response = requests.head(url, allow_redirects=True, timeout=self.request_timeout)
+            lease.responded()
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, "html.parser")
-            links = soup.find_all(
-                "a",
-                href=lambda href: href
-                and (
-                    href.endswith(".jpg")
-                    or href.endswith(".png")
-                    or href.endswith(".gif")
-                    or href.endswith(".mp4")
-                    or href.endswith(".webm")
-                ),
-            )
-            if not os.path.exists(output_path):
-                os.makedirs(output_path)
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                for link in links:
-                    executor.submit(self.download_file, link, output_path, host_type)
-            self.logger.info(f"Downloaded all files from {url} successfully!")
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"An error occurred: {str(e)}")
+            length = response.headers.get("Content-Length")
+            return int(length) if length and length.isdigit() else None
+        try:
+            return self._with_retries(url, head)
         except Exception as e:
-            self.logger.error(f"An unexpected error occurred: {str(e)}")
+            self.logger.warning(f"Could not check the size of {url}, it stays unverified: {str(e)}")
+            return None
 
-    def download_file(self, link, output_path, host_type):
+    def watch(self, stop_event=None, **kwargs):
         try:
-            link_href = link["href"]
-            if host_type == "2ch":
-                path = DVACH + link_href
-            elif host_type == "arhivach":
-                if any(extension in link_href for extension in IMAGE_EXT):
-                    path = ARCHIVACH + link_href
-                elif any(extension in link_href for extension in VIDEO_EXT):
-                    path = link_href
-            if link_href.endswith(tuple(IMAGE_EXT)):
-                save_folder = os.path.join(output_path, 'images')
-            elif link_href.endswith(tuple(VIDEO_EXT)):
-                save_folder = os.path.join(output_path, 'videos')
+            watch_threads(self, stop_event, **kwargs)
+        finally:
+            self._finish_run()
+
+    def download_from_host(self, output_path, host_type, url):
+        Scheduler(self, 1, self.priority).run([(url, output_path, host_type)])
+
+    def fetch_links(self, url, host_type):
+        return self._extract_page(url, host_type)[0]
+
+    def _extract_page(self, url, host_type):
+        # arhivach pages are finished archives: once cached they never change
+        immutable = host_type == "arhivach"
+        with self.metrics.span("page", url=url):
+            json_url = dvach_json_url(url) if host_type == "2ch" and self.use_json_api else None
+            if json_url:
+                try:
+                    return self._fetch_and_extract(json_url, lambda: JsonExtractor(MEDIA_EXT))
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    self.logger.warning(f"Thread API is unavailable for {url}, parsing the page instead: {str(e)}")
+            return self._fetch_and_extract(url, lambda: get_extractor(self.extractor, MEDIA_EXT), immutable)
+
+    def _cached_page(self, url):
+        return self.page_cache.get(url) if self.page_cache is not None else None
+
+    def _page_headers(self, cached):
+        return PageCache.validators(cached) if cached is not None else {}
+
+    def _is_immutable(self, headers, immutable):
+        return immutable or "immutable" in headers.get("Cache-Control", "")
+
+    def _revalidated_links(self, url, cached, headers, make_extractor, immutable):
+        self.page_cache.revalidated(url, headers, self._is_immutable(headers, immutable))
+        self.logger.debug(f"Page {url} has not changed, using the cached links.")
+        if cached.links is not None:
+            return cached.links, cached.sizes
+        extractor = make_extractor()
+        return extractor.extract(self.page_cache.body(url)), extractor.sizes
+
+    def _fetch_and_extract(self, url, make_extractor, immutable=False):
+        cached = self._cached_page(url)
+        if cached is not None and cached.immutable and cached.links is not None:
+            return cached.links, cached.sizes
+
+        def fetch(lease):
+            extractor = make_extractor()
+            compress = compressor() if self.page_cache is not None else None
+            body = []
+            parsing = 0.0
+            with requests.get(url, headers=self._page_headers(cached), stream=True,
+                              timeout=self.request_timeout) as response:
+                lease.responded()
+                if response.status_code == 304 and cached is not None:
+                    return self._revalidated_links(url, cached, response.headers, make_extractor, immutable)
+                response.raise_for_status()
+                for chunk in response.iter_content(PAGE_CHUNK_SIZE):
+                    started = time.perf_counter()
+                    extractor.feed(chunk)
+                    parsing += time.perf_counter() - started
+                    if compress is not None:
+                        body.append(compress.compress(chunk))
+            started = time.perf_counter()
+            links = extractor.close()
+            self.metrics.stages.observe(parsing + time.perf_counter() - started, stage="parse")
+            if compress is not None:
+                body.append(compress.flush())
+                self.page_cache.put(url, response.headers, b"".join(body), links, extractor.sizes,
+                                    self._is_immutable(response.headers, immutable))
+            return links, extractor.sizes
+        return self._with_retries(url, fetch)
+
+    def _with_retries(self, url, action):
+        limiter = self.host_limits.for_url(url)
+        attempt = 0
+        while True:
+            lease = limiter.lease()
+            try:
+                result = action(lease)
+            except Exception as e:
+                transient, overloaded, retry_after = self._describe_error(e)
+                lease.release(overloaded, retry_after)
+                self._record_request(url, lease, "error")
+                if not self.retry_policy.should_retry(attempt, transient):
+                    raise
+                delay = self.retry_policy.delay(attempt, retry_after)
+                self.logger.warning(f"Retrying {url} in {delay:.1f}s: {str(e)}")
+                self.metrics.retries.inc(host=host_of(url))
+                time.sleep(delay)
+                attempt += 1
             else:
-                save_folder = output_path
-            if not os.path.exists(save_folder):
-                os.makedirs(save_folder)
+                lease.release()
+                self._record_request(url, lease, "ok")
+                return result
+
+    def _record_request(self, url, lease, outcome):
+        host = host_of(url)
+        self.metrics.requests.inc(host=host, outcome=outcome)
+        if lease.latency is not None:
+            self.metrics.latency.observe(lease.latency, host=host)
+
+    def _describe_error(self, e):
+        response = getattr(e, "response", None)
+        if response is not None:
+            return describe_status(response.status_code, response.headers)
+        if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            return True, True, None
+        # copy_response reads the raw urllib3 stream, so a dropped connection surfaces as ProtocolError
+        if isinstance(e, (requests.exceptions.ChunkedEncodingError, ProtocolError, IncompleteDownload,
+                          RangeNotSatisfiable)):
+            return True, False, None
+        return False, False, None
+
+    def _finish_run(self):
+        self.writer.sync()
+        # the writer threads start again on the next run's first write
+        self.writer.close()
+        if self.postprocess is not None:
+            self.postprocess.wait()
+
+    def _log_thread_done(self, url, failed):
+        if failed:
+            self.logger.warning(f"Finished {url} with {failed} failed file(s).")
+        else:
+            self.logger.info(f"Downloaded all files from {url} successfully!")
+
+    def _claim(self, filename, path=None, thread_url=None):
+        with self._in_flight_lock:
+            if filename not in self._in_flight:
+                self._in_flight.add(filename)
+                return True
+        self.logger.info(f"File {filename} is already being downloaded. Skipping duplicate link.")
+        self.events.emit(events.FILE_SKIPPED, thread_url=thread_url, file_url=path, filename=filename)
+        return False
+
+    def _release(self, filename):
+        with self._in_flight_lock:
+            self._in_flight.discard(filename)
+
+    def _ensure_folder(self, folder):
+        self.folders.ensure(folder)
+
+    def _manifest_for(self, output_path):
+        if not self.manifest:
+            return None
+        with self._manifests_lock:
+            manifest = self.manifests.get(output_path)
+            if manifest is None:
+                manifest = self.manifests[output_path] = Manifest(output_path)
+        return manifest
+
+    def _already_downloaded(self, filename, path, link_href, manifest):
+        # both lookups are in memory: the manifest is loaded once per thread
+        # and the folder listing once per folder
+        if not self.folders.exists(filename):
+            return False
+        if manifest is not None and filename not in manifest:
+            # finished before the thread had a manifest, possibly by the old
+            # engine that wrote straight to the final name, so a crash could
+            # have left it truncated: verify() checks its size with the server
+            manifest.record(filename, path, link_href, os.path.getsize(filename), verified=False)
+        return True
+
+    def download_file(self, link_href, output_path, host_type, thread_url=None):
+        path = link_href
+        try:
+            path = build_file_url(link_href, host_type)
+            save_folder = media_folder(output_path, link_href)
+            self._ensure_folder(save_folder)
             filename = os.path.join(save_folder, os.path.basename(path))
-            if os.path.exists(filename):
-                self.logger.info(f"File {filename} already exists. Skipping download.")
-                return
-            with open(filename, "wb") as file:
-                file.write(requests.get(path).content)
-            self.logger.info(f"Downloaded {filename} successfully!")
+            if not self._claim(filename, path, thread_url):
+                return True
+            try:
+                manifest = self._manifest_for(output_path)
+                if self._already_downloaded(filename, path, link_href, manifest):
+                    self.logger.info(f"File {filename} already exists. Skipping download.")
+                    self.events.emit(events.FILE_SKIPPED, thread_url=thread_url, file_url=path, filename=filename)
+                    return True
+                if self._link_known_url(path, filename, thread_url, manifest, link_href):
+                    return True
+                sink = self._new_sink(filename, path)
+                self.events.emit(events.FILE_STARTED, thread_url=thread_url, file_url=path, filename=filename)
+                with self.metrics.span("file", url=path):
+                    digest = self._with_retries(path,
+                                                lambda lease: self._fetch_to_sink(path, sink, lease, thread_url))
+                    self._store_downloaded(path, filename, sink, digest, thread_url, manifest, link_href)
+            finally:
+                self._release(filename)
+            return True
+        except DownloadStopped:
+            self.logger.info(f"Stopped downloading {link_href}.")
+            return False
         except Exception as e:
-            self.logger.error(f"An error occurred while downloading file {link['href']}: {str(e)}")
+            self.logger.error(f"An error occurred while downloading file {link_href}: {str(e)}")
+            self.events.emit(events.ERROR, thread_url=thread_url, file_url=path, error=str(e))
+            return False
+
+    def _progress_callback(self, path, sink, thread_url):
+        def progress(count):
+            if self.stopped.is_set():
+                raise DownloadStopped(f"Download of {path} stopped")
+            self.events.emit(events.FILE_PROGRESS, thread_url=thread_url, file_url=path, filename=sink.filename,
+                             bytes=count, total=sink.expected_size)
+        return progress
+
+    def _throttle_callback(self, thread_url):
+        if self.bandwidth is None:
+            return None
+        return lambda count: self.bandwidth.throttle(count, thread_url)
+
+    def _new_sink(self, filename, path):
+        hashed = self.content_store is not None or self.manifest
+        part_filename = filename + PART_SUFFIX
+        sink = FileSink(filename, path, hash_name=CONTENT_HASH if hashed else None,
+                        preallocate=self.preallocate, fsync=self.fsync == "always",
+                        part_exists=self.folders.exists(part_filename))
+        # the sink is about to create the part; a later pass over this folder
+        # must stat it instead of trusting the listing taken before it existed
+        self.folders.add(part_filename)
+        return sink
+
+    def _link_known_url(self, path, filename, thread_url=None, manifest=None, link_href=None):
+        if self.content_store is None:
+            return False
+        digest = self.content_store.lookup_url(path)
+        if digest is None:
+            return False
+        self.content_store.link(digest, filename)
+        self.folders.add(filename)
+        if manifest is not None:
+            manifest.record(filename, path, link_href, os.path.getsize(filename), digest)
+        self.logger.info(f"Linked {filename} from the content store.")
+        self.events.emit(events.FILE_SKIPPED, thread_url=thread_url, file_url=path, filename=filename)
+        return True
+
+    def _match_known_content(self, path, sink, status, headers):
+        if self.content_store is None:
+            return None
+        digest = self.content_store.match_response(path, status, headers)
+        if digest:
+            sink.discard()
+        return digest
+
+    def _store_downloaded(self, path, filename, sink, digest, thread_url=None, manifest=None, link_href=None):
+        self.metrics.stages.observe(sink.write_seconds, stage="disk_write")
+        self.folders.add(filename)
+        if not digest:
+            self.writer.committed(filename)
+        if self.content_store is None:
+            self.logger.info(f"Downloaded {filename} successfully!")
+        elif digest:
+            self.content_store.link(digest, filename)
+            self.logger.info(f"Linked {filename} from the content store.")
+        else:
+            self.content_store.adopt(filename, sink.digest, path, sink.etag)
+            self.logger.info(f"Downloaded {filename} successfully!")
+        size = os.path.getsize(filename)
+        if manifest is not None:
+            manifest.record(filename, path, link_href, size, digest or sink.digest, sink.etag)
+        self.events.emit(events.FILE_DONE, thread_url=thread_url, file_url=path, filename=filename, bytes=size)
+
+    def _fetch_to_sink(self, path, sink, lease, thread_url=None):
+        headers = sink.resume_headers()
+        with requests.get(path, headers=headers, stream=True, timeout=self.request_timeout) as response:
+            lease.responded()
+            if response.status_code != 416:
+                response.raise_for_status()
+            digest = self._match_known_content(path, sink, response.status_code, response.headers)
+            if digest:
+                return digest
+            with sink.begin(response.status_code, response.headers):
+                copy_response(response, sink, self.chunk_size, self._progress_callback(path, sink, thread_url),
+                              self.writer if self.writers else None, self._throttle_callback(thread_url))
+        return None
+
+
+from .async_engine import AsyncDownloader
+from .crawl import ArhivachIndex, DvachCatalog, VisitedIndex, crawl_jobs
+from .scheduler import FairQueue, Scheduler
+from .watcher import ThreadWatcher, watch_threads
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# worker processes are spawned and re-import this module, so run only when executed
+if __name__ == "__main__":
+    sys.exit(main())
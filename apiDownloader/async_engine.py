@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import MEDIA_EXT, Downloader, DownloadStopped, build_file_url, compressor, events, host_of, media_folder
+from .extract import JsonExtractor, dvach_json_url, get_extractor
+from .ratelimit import describe_status
+from .storage import IncompleteDownload, RangeNotSatisfiable
+
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+
+
+class AsyncDownloader(Downloader):
+    """Downloads on a single asyncio event loop.
+
+    Connections are pooled and kept alive per host, so a thread with hundreds
+    of attachments pays for one TCP+TLS handshake per pooled connection
+    instead of one per file. `max_workers` caps the files in flight across all
+    hosts and `max_per_host` is the ceiling of the adaptive per-host window.
+    Other keyword arguments are the same as for `Downloader`.
+    """
+
+    def __init__(self, urls, output_path, max_workers=64, max_per_host=8, timeout=60, **kwargs):
+        super().__init__(urls, output_path, max_workers=max_workers, max_per_host=max_per_host, timeout=timeout,
+                         **kwargs)
+        self.max_per_host = max_per_host
+        self._global_limit = None
+
+    def start_download(self):
+        if aiohttp is None:
+            raise ImportError("AsyncDownloader requires aiohttp: pip install aiohttp")
+        asyncio.run(self._run(self._thread_jobs()))
+
+    async def _run(self, thread_jobs):
+        self._global_limit = asyncio.Semaphore(self.max_workers)
+        self.metrics.workers.set(self.max_workers)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_workers,
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+        )
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(*(self.download_from_host_async(session, output_path, host_type, url)
+                                   for url, output_path, host_type in thread_jobs))
+        self._finish_run()
+
+    async def _with_retries_async(self, url, action):
+        limiter = self.host_limits.for_url(url)
+        attempt = 0
+        while True:
+            lease = await limiter.lease_async()
+            try:
+                result = await action(lease)
+            except Exception as e:
+                transient, overloaded, retry_after = self._describe_error(e)
+                lease.release(overloaded, retry_after)
+                self._record_request(url, lease, "error")
+                if not self.retry_policy.should_retry(attempt, transient):
+                    raise
+                delay = self.retry_policy.delay(attempt, retry_after)
+                self.logger.warning(f"Retrying {url} in {delay:.1f}s: {str(e)}")
+                self.metrics.retries.inc(host=host_of(url))
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                lease.release()
+                self._record_request(url, lease, "ok")
+                return result
+
+    def _describe_error(self, e):
+        if isinstance(e, aiohttp.ClientResponseError):
+            return describe_status(e.status, e.headers or {})
+        if isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+            return True, True, None
+        if isinstance(e, (aiohttp.ClientPayloadError, IncompleteDownload, RangeNotSatisfiable)):
+            return True, False, None
+        return False, False, None
+
+    async def download_from_host_async(self, session, output_path, host_type, url):
+        try:
+            links = list(dict.fromkeys(await self.fetch_links_async(session, url, host_type)))
+            self._ensure_folder(output_path)
+            self.events.emit(events.THREAD_STARTED, thread_url=url, total=len(links))
+            results = await asyncio.gather(*(self.download_file_async(session, link, output_path, host_type, url)
+                                             for link in links))
+            failed = results.count(False)
+            self._log_thread_done(url, failed)
+            self.events.emit(events.THREAD_DONE, thread_url=url, failed=failed)
+        except aiohttp.ClientError as e:
+            self.logger.error(f"An error occurred: {str(e)}")
+            self.events.emit(events.ERROR, thread_url=url, error=str(e))
+        except Exception as e:
+            self.logger.error(f"An unexpected error occurred: {str(e)}")
+            self.events.emit(events.ERROR, thread_url=url, error=str(e))
+
+    async def fetch_links_async(self, session, url, host_type):
+        with self.metrics.span("page", url=url):
+            return await self._fetch_links_async(session, url, host_type)
+
+    async def _fetch_links_async(self, session, url, host_type):
+        json_url = dvach_json_url(url) if host_type == "2ch" and self.use_json_api else None
+        if json_url:
+            try:
+                return await self._fetch_and_extract_async(session, json_url, lambda: JsonExtractor(MEDIA_EXT))
+            except (aiohttp.ClientError, ValueError) as e:
+                self.logger.warning(f"Thread API is unavailable for {url}, parsing the page instead: {str(e)}")
+        return await self._fetch_and_extract_async(session, url, lambda: get_extractor(self.extractor, MEDIA_EXT),
+                                                   host_type == "arhivach")
+
+    async def _fetch_and_extract_async(self, session, url, make_extractor, immutable=False):
+        cached = self._cached_page(url)
+        if cached is not None and cached.immutable and cached.links is not None:
+            return cached.links
+
+        async def fetch(lease):
+            async with session.get(url, headers=self._page_headers(cached)) as response:
+                lease.responded()
+                if response.status == 304 and cached is not None:
+                    return response.headers, None
+                response.raise_for_status()
+                return response.headers, await response.read()
+        headers, content = await self._with_retries_async(url, fetch)
+        loop = asyncio.get_running_loop()
+        if content is None:
+            links, _ = await loop.run_in_executor(None, self._revalidated_links, url, cached, headers,
+                                                  make_extractor, immutable)
+            return links
+        return await loop.run_in_executor(None, self._timed_extract, make_extractor(), content, url, headers,
+                                          immutable)
+
+    def _timed_extract(self, extractor, content, url=None, headers=None, immutable=False):
+        started = time.perf_counter()
+        try:
+            result = extractor.extract(content)
+        finally:
+            self.metrics.stages.observe(time.perf_counter() - started, stage="parse")
+        if self.page_cache is not None and url is not None:
+            compress = compressor()
+            self.page_cache.put(url, headers, compress.compress(content) + compress.flush(), result,
+                                extractor.sizes, self._is_immutable(headers, immutable))
+        return result
+
+    async def download_file_async(self, session, link_href, output_path, host_type, thread_url=None):
+        path = link_href
+        try:
+            path = build_file_url(link_href, host_type)
+            save_folder = media_folder(output_path, link_href)
+            filename = os.path.join(save_folder, os.path.basename(path))
+            if not self._claim(filename, path, thread_url):
+                return True
+            try:
+                # everything that touches the disk runs off the event loop: folder
+                # listings, manifest loads, the content store and the part file
+                loop = asyncio.get_running_loop()
+                manifest, downloaded = await loop.run_in_executor(None, self._local_state, save_folder, filename,
+                                                                  path, link_href, output_path)
+                if downloaded:
+                    self.logger.info(f"File {filename} already exists. Skipping download.")
+                    self.events.emit(events.FILE_SKIPPED, thread_url=thread_url, file_url=path, filename=filename)
+                    return True
+                if await loop.run_in_executor(None, self._link_known_url, path, filename, thread_url, manifest,
+                                              link_href):
+                    return True
+                sink = await loop.run_in_executor(None, self._new_sink, filename, path)
+                async with self._global_limit:
+                    self.metrics.workers_busy.inc()
+                    try:
+                        self.events.emit(events.FILE_STARTED, thread_url=thread_url, file_url=path,
+                                         filename=filename)
+                        with self.metrics.span("file", url=path):
+                            digest = await self._with_retries_async(
+                                path, lambda lease: self._fetch_to_sink_async(session, path, sink, lease, thread_url))
+                            await loop.run_in_executor(None, self._store_downloaded, path, filename, sink, digest,
+                                                       thread_url, manifest, link_href)
+                    finally:
+                        self.metrics.workers_busy.inc(-1)
+            finally:
+                self._release(filename)
+            return True
+        except DownloadStopped:
+            self.logger.info(f"Stopped downloading {link_href}.")
+            return False
+        except Exception as e:
+            self.logger.error(f"An error occurred while downloading file {link_href}: {str(e)}")
+            self.events.emit(events.ERROR, thread_url=thread_url, file_url=path, error=str(e))
+            return False
+
+    def _local_state(self, save_folder, filename, path, link_href, output_path):
+        self._ensure_folder(save_folder)
+        manifest = self._manifest_for(output_path)
+        return manifest, self._already_downloaded(filename, path, link_href, manifest)
+
+    async def _fetch_to_sink_async(self, session, path, sink, lease, thread_url=None):
+        loop = asyncio.get_running_loop()
+        headers = await loop.run_in_executor(None, sink.resume_headers)
+        async with session.get(path, headers=headers) as response:
+            lease.responded()
+            if response.status != 416:
+                response.raise_for_status()
+            digest = await loop.run_in_executor(None, self._match_known_content, path, sink, response.status,
+                                                response.headers)
+            if digest:
+                return digest
+            progress = self._progress_callback(path, sink, thread_url)
+            # begin() may re-hash a resumed part and commit() may fsync, so both run in the executor
+            await loop.run_in_executor(None, sink.begin, response.status, response.headers)
+            try:
+                if self.writers:
+                    await self._stream_to_writer(response, sink, progress, thread_url)
+                else:
+                    while True:
+                        chunk = await response.content.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        sink.write(chunk)
+                        progress(len(chunk))
+                        if self.bandwidth is not None:
+                            await self.bandwidth.throttle_async(len(chunk), thread_url)
+            except BaseException:
+                sink.abort()
+                raise
+            await loop.run_in_executor(None, sink.commit)
+        return None
+
+    async def _stream_to_writer(self, response, sink, progress, thread_url=None):
+        # disk writes leave the event loop; a full writer queue parks this
+        # download in an executor thread until the disk catches up
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await response.content.read(self.chunk_size)
+                if not chunk:
+                    break
+                if not self.writer.try_write(sink, chunk):
+                    await loop.run_in_executor(None, self.writer.write, sink, chunk)
+                progress(len(chunk))
+                if self.bandwidth is not None:
+                    await self.bandwidth.throttle_async(len(chunk), thread_url)
+        finally:
+            await loop.run_in_executor(None, self.writer.flush, sink)
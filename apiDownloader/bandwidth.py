@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import re
+import threading
+import time
+
+from . import events
+from .ratelimit import TokenBucket
+
+# a bucket holds this many seconds of traffic, so bursts stay short
+BURST_SECONDS = 0.1
+MIN_BURST = 64 * 1024
+PROFILE_CHECK_INTERVAL = 1.0
+UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3, "gb": 1024 ** 3}
+RATE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)(?:/s)?\s*$", re.IGNORECASE)
+
+
+def parse_rate(value):
+    """Bytes per second from a number or a string like "512KB", "2M" or "1.5MB/s"; None means unlimited."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    match = RATE_PATTERN.match(value)
+    if not match or match.group(2).lower() not in UNITS:
+        raise ValueError(f"Invalid rate: {value}")
+    rate = float(match.group(1)) * UNITS[match.group(2).lower()]
+    return rate if rate > 0 else None
+
+
+def parse_time(value):
+    hours, _, minutes = value.partition(":")
+    return datetime.time(int(hours), int(minutes or 0))
+
+
+class Profile:
+    """Limits for a time-of-day window; `start > end` wraps over midnight."""
+
+    def __init__(self, start, end, limit=None, per_thread=None):
+        self.start = parse_time(start) if isinstance(start, str) else start
+        self.end = parse_time(end) if isinstance(end, str) else end
+        self.limit = parse_rate(limit)
+        self.per_thread = parse_rate(per_thread)
+
+    def active(self, now):
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+
+class BandwidthScheduler:
+    """Byte-level throttle shared by every download of one or more downloaders.
+
+    `limit` caps the total bytes/s and `per_thread` the bytes/s of each
+    thread. Workers report every chunk they receive through `throttle()`,
+    which reserves tokens in the thread's bucket and then in the global one
+    and sleeps until both are paid for. Reservations queue up in the order
+    they are made, so every file in flight gets an equal share of the rate,
+    chunk by chunk: a 100 MB webm gets no more than each of the jpgs next to
+    it. Because the sleep happens before the next read, TCP flow control
+    slows the server down instead of the data piling up in socket buffers.
+
+    `profiles` replace both limits during their time window; the first
+    active profile wins and the defaults apply outside all of them.
+    """
+
+    def __init__(self, limit=None, per_thread=None, profiles=(), clock=None):
+        self.default_limit = parse_rate(limit)
+        self.default_per_thread = parse_rate(per_thread)
+        self.profiles = list(profiles)
+        self.clock = clock or datetime.datetime.now
+        self.limit = None
+        self.per_thread = None
+        self._global = None
+        self._threads = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self._apply(*self._current_limits())
+
+    @classmethod
+    def from_settings(cls, settings, clock=None):
+        """Build from the `bandwidth` section of settings.json::
+
+            {"limit": "4MB", "per_thread": "1MB",
+             "schedule": [{"from": "09:00", "to": "19:00", "limit": "512KB"}]}
+        """
+        profiles = [Profile(entry["from"], entry["to"], entry.get("limit"), entry.get("per_thread"))
+                    for entry in settings.get("schedule", [])]
+        return cls(settings.get("limit"), settings.get("per_thread"), profiles, clock)
+
+    def _current_limits(self):
+        now = self.clock().time()
+        for profile in self.profiles:
+            if profile.active(now):
+                return profile.limit, profile.per_thread
+        return self.default_limit, self.default_per_thread
+
+    def _apply(self, limit, per_thread):
+        if limit != self.limit:
+            self._global = _retune(self._global, limit)
+            self.limit = limit
+        if per_thread != self.per_thread:
+            self._threads = {key: _retune(bucket, per_thread) for key, bucket in self._threads.items()}
+            self.per_thread = per_thread
+
+    def _buckets(self, thread_url):
+        with self._lock:
+            now = time.monotonic()
+            if self.profiles and (self._checked is None or now - self._checked >= PROFILE_CHECK_INTERVAL):
+                self._checked = now
+                self._apply(*self._current_limits())
+            buckets = []
+            if self.per_thread and thread_url is not None:
+                bucket = self._threads.get(thread_url)
+                if bucket is None:
+                    bucket = self._threads[thread_url] = _bucket(self.per_thread)
+                buckets.append(bucket)
+            if self._global is not None:
+                buckets.append(self._global)
+            return buckets
+
+    def forget(self, thread_url):
+        with self._lock:
+            self._threads.pop(thread_url, None)
+
+    def on_event(self, event):
+        if event.kind == events.THREAD_DONE:
+            self.forget(event.thread_url)
+
+    def throttle(self, count, thread_url=None):
+        """Account for `count` received bytes, sleeping while over the limits."""
+        for bucket in self._buckets(thread_url):
+            delay = bucket.reserve(count)
+            if delay:
+                time.sleep(delay)
+
+    async def throttle_async(self, count, thread_url=None):
+        for bucket in self._buckets(thread_url):
+            delay = bucket.reserve(count)
+            if delay:
+                await asyncio.sleep(delay)
+
+
+def _bucket(rate):
+    return TokenBucket(rate, max(MIN_BURST, rate * BURST_SECONDS))
+
+
+def _retune(bucket, rate):
+    if rate is None:
+        return None
+    if bucket is None:
+        return _bucket(rate)
+    bucket.set_rate(rate, max(MIN_BURST, rate * BURST_SECONDS))
+    return bucket
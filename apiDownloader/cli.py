@@ -0,0 +1,179 @@
+"""Headless entry point: ``python -m apiDownloader [urls...]``.
+
+URLs come from the command line, a file (``-i links.txt``) or stdin
+(``-i -``). Defaults are read from ``settings.json``, the same file the GUI
+writes, including the ``bandwidth`` limits and their time-of-day schedule.
+Every job goes through a `JobQueue` stored next to the downloads, so an
+interrupted run picks up where it stopped. With ``--daemon`` the queue
+is polled for threads added later by ``--enqueue``. ``--crawl`` walks a
+2ch board catalog or the arhivach index instead of taking thread URLs.
+``--verify`` checks already downloaded files against the per-thread
+manifests first.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+
+from . import (ArhivachIndex, BandwidthScheduler, Downloader, DvachCatalog, JobQueue, PageCache, PostProcessor,
+               VisitedIndex)
+
+SETTINGS_FILE = "settings.json"
+QUEUE_FILE = "jobs.sqlite"
+VISITED_FILE = "crawl.sqlite"
+PAGE_CACHE_FILE = "pages.sqlite"
+POLL_INTERVAL = 30
+
+
+def load_settings(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def read_urls(urls, input_file):
+    urls = list(urls)
+    if input_file == "-":
+        # stdin is read but left open, it belongs to the process
+        urls.extend(line.strip() for line in sys.stdin)
+    elif input_file:
+        with open(input_file, "r") as file:
+            urls.extend(line.strip() for line in file)
+    return [url for url in urls if url and not url.startswith("#")]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m apiDownloader", description="Download media from 2ch/arhivach threads.")
+    parser.add_argument("urls", nargs="*", help="thread URLs")
+    parser.add_argument("-i", "--input", help="file with one URL per line, '-' for stdin")
+    parser.add_argument("-o", "--output", help="download folder (settings: download_path)")
+    parser.add_argument("-j", "--workers", type=int, help="parallel file downloads (settings: threads)")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="settings file, default: %(default)s")
+    parser.add_argument("--log-file", help="log file (settings: log_file)")
+    parser.add_argument("--queue", help=f"job queue database, default: <output>/{QUEUE_FILE}")
+    parser.add_argument("--enqueue", action="store_true", help="only add the URLs to the queue")
+    parser.add_argument("--status", action="store_true", help="print queue statistics and exit")
+    parser.add_argument("--daemon", action="store_true", help="keep polling the queue for new threads")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="daemon poll interval, seconds")
+    parser.add_argument("--crawl", action="append", choices=("2ch", "arhivach"),
+                        help="discover threads from a 2ch board catalog or the arhivach index")
+    parser.add_argument("--board", help="board to crawl, e.g. b")
+    parser.add_argument("--tag", help="crawl only threads with this tag")
+    parser.add_argument("--query", help="arhivach search query")
+    parser.add_argument("--since", help="crawl threads from this date, YYYY-MM-DD")
+    parser.add_argument("--until", help="crawl threads up to this date, YYYY-MM-DD")
+    parser.add_argument("--max-pages", type=int, help="arhivach index pages to read")
+    parser.add_argument("--limit-rate", help="total download rate, e.g. 2MB (settings: bandwidth.limit)")
+    parser.add_argument("--thread-rate", help="download rate per thread, e.g. 512KB (settings: bandwidth.per_thread)")
+    parser.add_argument("--page-cache", help=f"thread page cache, default: <output>/{PAGE_CACHE_FILE}")
+    parser.add_argument("--no-page-cache", action="store_true", help="always fetch and parse thread pages")
+    parser.add_argument("--postprocess", action="store_true",
+                        help="build thumbnails and a per-thread media index while downloading (settings: postprocess)")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-hash finished files of the given threads and download broken ones again")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--metrics-json", help="write a metrics snapshot to this file on exit")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def build_crawlers(args):
+    crawlers = []
+    for source in args.crawl or []:
+        if source == "2ch":
+            if not args.board:
+                raise SystemExit("--crawl 2ch needs --board")
+            crawlers.append(DvachCatalog(args.board, tag=args.tag, since=args.since, until=args.until))
+        else:
+            crawlers.append(ArhivachIndex(board=args.board, tag=args.tag, query=args.query, since=args.since,
+                                          until=args.until, max_pages=args.max_pages))
+    return crawlers
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    crawlers = build_crawlers(args)
+    settings = load_settings(args.settings)
+    output_path = os.path.join(args.output or settings.get("download_path") or ".", "")
+    max_workers = args.workers or settings.get("threads") or 5
+    log_file = args.log_file or settings.get("log_file")
+
+    logging.basicConfig(format="%(asctime)s - %(levelname)s - %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+    os.makedirs(output_path, exist_ok=True)
+    jobs = JobQueue(args.queue or os.path.join(output_path, QUEUE_FILE))
+
+    if args.status:
+        print(json.dumps(jobs.stats(), indent=2))
+        return 0
+
+    urls = read_urls(args.urls, args.input)
+    bandwidth = dict(settings.get("bandwidth") or {})
+    if args.limit_rate:
+        bandwidth["limit"] = args.limit_rate
+    if args.thread_rate:
+        bandwidth["per_thread"] = args.thread_rate
+    postprocess = PostProcessor() if args.postprocess or settings.get("postprocess") else None
+    page_cache = None
+    if not args.no_page_cache:
+        page_cache = PageCache(args.page_cache or os.path.join(output_path, PAGE_CACHE_FILE))
+    downloader = Downloader(urls, output_path, max_workers=max_workers,
+                            log_level=logging.DEBUG if args.verbose else logging.INFO,
+                            log_file=log_file, job_queue=jobs, page_cache=page_cache,
+                            bandwidth=BandwidthScheduler.from_settings(bandwidth) if bandwidth else None,
+                            postprocess=postprocess)
+    if args.enqueue:
+        jobs.add_all(downloader._thread_jobs())
+        return 0
+    if args.metrics_port:
+        downloader.metrics.serve(args.metrics_port)
+
+    # SIGTERM stops the downloader instead of raising in the main thread: the
+    # workers drop queued files and interrupt the ones in flight, the run
+    # returns once they have exited, and only then is the job queue closed
+    terminated = []
+
+    def terminate(signum, frame):
+        terminated.append(signum)
+        downloader.stop()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        if args.verify:
+            downloader.verify()
+        downloader.start_download()
+        # the command line URLs are queued now, later cycles only drain the queue
+        downloader.urls = []
+        if crawlers:
+            visited = VisitedIndex(os.path.join(output_path, VISITED_FILE))
+            downloader.crawl(crawlers, visited)
+        while args.daemon and not downloader.stopped.wait(args.poll_interval):
+            if crawlers:
+                downloader.crawl(crawlers, visited)
+            if jobs.unfinished():
+                downloader.start_download()
+        unfinished = jobs.unfinished()
+    except KeyboardInterrupt:
+        downloader.logger.info("Interrupted, unfinished jobs stay in the queue.")
+        return 130
+    finally:
+        jobs.close()
+        if page_cache is not None:
+            page_cache.close()
+        if postprocess is not None:
+            postprocess.close()
+        if args.metrics_json:
+            with open(args.metrics_json, "w") as file:
+                file.write(downloader.metrics.to_json(indent=2))
+    if terminated:
+        downloader.logger.info("Stopped, unfinished jobs stay in the queue.")
+        return 128 + terminated[0]
+    if unfinished:
+        downloader.logger.warning(f"{len(unfinished)} thread(s) have failed files and stay in the queue.")
+        return 1
+    return 0
+
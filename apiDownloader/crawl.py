@@ -0,0 +1,258 @@
+import datetime
+import json
+import re
+import sqlite3
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import urlencode, urljoin
+
+import requests
+
+ARHIVACH_THREAD_PATTERN = re.compile(r"/thread/(\d+)/?$")
+DATE_PATTERNS = (
+    (re.compile(r"\b(\d{2})\.(\d{2})\.(\d{4})\b"), lambda m: (m.group(3), m.group(2), m.group(1))),
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), lambda m: (m.group(1), m.group(2), m.group(3))),
+)
+ARHIVACH_PAGE_SIZE = 25
+
+
+def parse_date(value):
+    """A `date` from a `date`, a datetime, an ISO string or None."""
+    if value is None or isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return datetime.date.fromisoformat(value)
+
+
+def find_date(text):
+    for pattern, groups in DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            year, month, day = groups(match)
+            try:
+                return datetime.date(int(year), int(month), int(day))
+            except ValueError:
+                continue
+    return None
+
+
+class DiscoveredThread:
+    def __init__(self, url, host_type, date=None, title=""):
+        self.url = url
+        self.host_type = host_type
+        self.date = date
+        self.title = title
+
+
+class Crawler:
+    """Walks listing pages and yields `DiscoveredThread`s as each page is read.
+
+    `since`/`until` bound the thread date (inclusive); threads whose date
+    cannot be read from the listing are kept.
+    """
+
+    host_type = None
+
+    def __init__(self, since=None, until=None):
+        self.since = parse_date(since)
+        self.until = parse_date(until)
+
+    def in_range(self, date):
+        if date is None:
+            return True
+        if self.since and date < self.since:
+            return False
+        if self.until and date > self.until:
+            return False
+        return True
+
+    def threads(self, fetch):
+        """Yield discovered threads; `fetch(url)` returns the body of a listing page."""
+        raise NotImplementedError
+
+
+class DvachCatalog(Crawler):
+    """Live threads of a 2ch board from `<board>/catalog.json`.
+
+    `tag` keeps threads whose tags or subject contain it (case-insensitive).
+    """
+
+    host_type = "2ch"
+
+    def __init__(self, board, tag=None, since=None, until=None, base=None):
+        super().__init__(since, until)
+        self.board = board.strip("/")
+        self.tag = tag.lower() if tag else None
+        self.base = base
+
+    def threads(self, fetch):
+        from . import DVACH
+
+        base = self.base or DVACH
+        data = json.loads(fetch(f"{base}/{self.board}/catalog.json"))
+        for thread in data.get("threads", []):
+            timestamp = thread.get("timestamp")
+            date = datetime.date.fromtimestamp(timestamp) if timestamp else None
+            title = thread.get("subject") or ""
+            if self.tag and self.tag not in f"{thread.get('tags') or ''} {title}".lower():
+                continue
+            if self.in_range(date):
+                yield DiscoveredThread(f"{base}/{self.board}/res/{thread['num']}.html", self.host_type, date, title)
+
+
+class _ArhivachRows(HTMLParser):
+    """Collects `(href, text)` for every table row that links to a thread."""
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._flush()
+        elif tag == "a" and self._href is None:
+            href = dict(attrs).get("href") or ""
+            if ARHIVACH_THREAD_PATTERN.search(href):
+                self._href = href
+
+    def handle_endtag(self, tag):
+        if tag == "tr":
+            self._flush()
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def _flush(self):
+        if self._href:
+            self.rows.append((self._href, " ".join(" ".join(self._text).split())))
+        self._href = None
+        self._text = []
+
+    def close(self):
+        super().close()
+        self._flush()
+        return self.rows
+
+
+class ArhivachIndex(Crawler):
+    """Archived threads from the arhivach index, newest first.
+
+    `board` keeps rows that mention `/<board>/`, `tag` and `query` are passed
+    to the site search. Paging stops at `max_pages`, at the first empty page
+    or once a whole page is older than `since`.
+    """
+
+    host_type = "arhivach"
+
+    def __init__(self, board=None, tag=None, query=None, since=None, until=None, max_pages=None, base=None):
+        super().__init__(since, until)
+        self.board = f"/{board.strip('/')}/" if board else None
+        self.tag = tag
+        self.query = query
+        self.max_pages = max_pages
+        self.base = base
+
+    def page_url(self, page):
+        from . import ARCHIVACH
+
+        params = {key: value for key, value in (("tags", self.tag), ("q", self.query)) if value}
+        url = f"{self.base or ARCHIVACH}/index/{page * ARHIVACH_PAGE_SIZE}/"
+        return url + "?" + urlencode(params) if params else url
+
+    def threads(self, fetch):
+        page = 0
+        while self.max_pages is None or page < self.max_pages:
+            url = self.page_url(page)
+            parser = _ArhivachRows()
+            parser.feed(fetch(url).decode("utf-8", errors="replace"))
+            rows = parser.close()
+            if not rows:
+                return
+            dates = []
+            for href, text in rows:
+                date = find_date(text)
+                dates.append(date)
+                if self.board and self.board not in text:
+                    continue
+                if self.in_range(date):
+                    yield DiscoveredThread(urljoin(url, href), self.host_type, date, text)
+            known = [date for date in dates if date]
+            if self.since and known and max(known) < self.since:
+                return
+            page += 1
+
+
+class VisitedIndex:
+    """Thread URLs that earlier crawls have already handed to the downloader."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS visited (
+                url TEXT PRIMARY KEY,
+                host_type TEXT NOT NULL,
+                date TEXT,
+                first_seen REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, thread):
+        """Record `thread`; returns False if it was already known."""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO visited (url, host_type, date, first_seen) VALUES (?, ?, ?, ?)",
+                (thread.url, thread.host_type, thread.date.isoformat() if thread.date else None, time.time()))
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    def __contains__(self, url):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM visited WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+
+
+def crawl_jobs(downloader, crawlers, visited=None, found=None):
+    """Yield `(url, output_path, host_type)` for every new thread, page by page.
+
+    Listing pages go through the downloader's rate limits and retries, and
+    each job is yielded as soon as its listing page is parsed, so the
+    scheduler starts on the first threads while later pages are still being
+    fetched. Threads in `visited` are skipped, but yielded ones are not
+    recorded there: they go into `found` (URL -> `DiscoveredThread`) and the
+    caller adds them to `visited` once they are queued or downloaded, so a
+    crash cannot lose a thread that was only discovered.
+    """
+    found = {} if found is None else found
+    def fetch(url):
+        def get(lease):
+            response = requests.get(url, timeout=downloader.request_timeout)
+            lease.responded()
+            response.raise_for_status()
+            return response.content
+        return downloader._with_retries(url, get)
+
+    for crawler in crawlers:
+        try:
+            for thread in crawler.threads(fetch):
+                if thread.url in found or (visited is not None and thread.url in visited):
+                    continue
+                job = downloader._job_for(thread.url, thread.host_type)
+                if job:
+                    found[thread.url] = thread
+                    yield job
+        except Exception as e:
+            downloader.logger.error(f"Crawling stopped: {str(e)}")
@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INDEX_NAME = "index.sqlite"
+BLOBS_DIR = "blobs"
+FICLONE = 0x40049409
+
+
+class ContentStore:
+    """Keeps one copy of every downloaded file, addressed by its SHA-256.
+
+    Thread folders get hardlinks (or reflinks/copies where hardlinks are not
+    possible) to the blob. The SQLite index remembers which URL produced
+    which digest, so a repost of a known URL is linked without touching the
+    network, and a new URL whose size and ETag match a known blob is linked
+    as soon as the response headers arrive.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, BLOBS_DIR), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, INDEX_NAME), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                path TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_size_etag ON blobs (size, etag);
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _blob_path(self, digest, filename):
+        extension = os.path.splitext(filename)[1]
+        return os.path.join(self.root, BLOBS_DIR, digest[:2], digest + extension)
+
+    def _existing_blob(self, digest):
+        row = self._db.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def lookup_url(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+            if row and self._existing_blob(row[0]):
+                return row[0]
+        return None
+
+    def match_response(self, url, status, headers):
+        etag = headers.get("ETag")
+        content_length = headers.get("Content-Length")
+        if status != 200 or not etag or etag.startswith("W/") or not content_length:
+            return None
+        if headers.get("Content-Encoding", "identity") != "identity":
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM blobs WHERE size = ? AND etag = ?",
+                                   (int(content_length), etag)).fetchone()
+            if row and self._existing_blob(row[0]):
+                self._db.execute("INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)", (url, row[0]))
+                self._db.commit()
+                return row[0]
+        return None
+
+    def link(self, digest, filename):
+        with self._lock:
+            blob = self._existing_blob(digest)
+        if blob is None:
+            raise FileNotFoundError(f"Blob {digest} is missing from the content store")
+        _link_into_place(blob, filename)
+
+    def adopt(self, filename, digest, url, etag=None):
+        """Registers a freshly downloaded file as a blob, or links it to an existing one."""
+        with self._lock:
+            blob = self._existing_blob(digest)
+            if blob is None:
+                blob = self._blob_path(digest, filename)
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _link_into_place(filename, blob)
+                self._db.execute("INSERT OR REPLACE INTO blobs (digest, size, etag, path) VALUES (?, ?, ?, ?)",
+                                 (digest, os.path.getsize(blob), etag, blob))
+            elif not os.path.samefile(blob, filename):
+                _link_into_place(blob, filename)
+            self._db.execute("INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)", (url, digest))
+            self._db.commit()
+        return blob
+
+    def discard(self, digest):
+        """Forget a blob whose content turned out to be corrupt, so its URLs are fetched again."""
+        with self._lock:
+            blob = self._existing_blob(digest)
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            self._db.commit()
+        if blob is not None:
+            os.remove(blob)
+
+
+def _link_into_place(source, destination):
+    temp = destination + ".link"
+    if os.path.exists(temp):
+        os.remove(temp)
+    try:
+        os.link(source, temp)
+    except OSError:
+        if not _reflink(source, temp):
+            shutil.copyfile(source, temp)
+    os.replace(temp, destination)
+
+
+def _reflink(source, destination):
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        return False
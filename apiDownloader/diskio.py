@@ -0,0 +1,215 @@
+import os
+import queue
+import threading
+
+FSYNC_POLICIES = ("never", "batch", "always")
+FSYNC_BATCH = 32
+MAX_PENDING_CHUNKS = 32
+
+_FLUSH = object()
+_SYNC = object()
+_STOP = object()
+
+
+class FolderCache:
+    """Creates each folder once and answers existence checks from one listing per folder.
+
+    The first `exists()` for a folder lists it with `os.scandir`; files the
+    downloader creates afterwards are recorded with `add()`, so later checks
+    never touch the disk.
+    """
+
+    def __init__(self):
+        self._created = set()
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, folder):
+        if folder in self._created:
+            return
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            self._created.add(folder)
+
+    def exists(self, filename):
+        folder, name = os.path.split(filename)
+        with self._lock:
+            names = self._listings.get(folder)
+            if names is None:
+                try:
+                    with os.scandir(folder or ".") as entries:
+                        names = {entry.name for entry in entries}
+                except FileNotFoundError:
+                    names = set()
+                self._listings[folder] = names
+            return name in names
+
+    def add(self, filename):
+        folder, name = os.path.split(filename)
+        with self._lock:
+            names = self._listings.get(folder)
+            if names is not None:
+                names.add(name)
+
+    def discard(self, filename):
+        folder, name = os.path.split(filename)
+        with self._lock:
+            names = self._listings.get(folder)
+            if names is not None:
+                names.discard(name)
+
+
+class BufferPool:
+    """Fixed set of reusable chunk buffers; `acquire()` blocks when all are in flight."""
+
+    def __init__(self, count, size):
+        self.size = size
+        self._free = queue.LifoQueue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self):
+        return self._free.get()
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+
+class WriterPool:
+    """Dedicated disk writer threads fed by the network workers.
+
+    Every `FileSink` is pinned to one writer, so its chunks are written in
+    order, while different files are written in parallel. Queues are
+    bounded: when the disk falls behind, `write()` blocks the network worker
+    instead of buffering the whole download in memory. Buffers from `buffers`
+    go back to the pool once written, so streaming a file copies each chunk
+    exactly once, from the socket into the buffer.
+
+    `fsync` is "never" (leave it to the OS), "always" (each file before its
+    rename) or "batch" (every `fsync_batch` finished files and at `sync()`).
+    """
+
+    def __init__(self, workers=2, chunk_size=256 * 1024, max_pending=MAX_PENDING_CHUNKS, fsync="never",
+                 fsync_batch=FSYNC_BATCH):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.workers = workers
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self.buffers = BufferPool(max_pending, chunk_size)
+        self._queues = [queue.Queue(max_pending) for _ in range(workers)]
+        self._errors = {}
+        self._unsynced = []
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for tasks in self._queues:
+                thread = threading.Thread(target=self._run, args=(tasks,), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _queue_for(self, sink):
+        if not self._threads:
+            self._start()
+        return self._queues[id(sink) % self.workers]
+
+    def write(self, sink, data, count=None, buffer=None):
+        """Queue `data[:count]` for `sink`; `buffer` is returned to the pool once written."""
+        self._queue_for(sink).put((sink, data, count, buffer))
+
+    def try_write(self, sink, data):
+        try:
+            self._queue_for(sink).put_nowait((sink, data, None, None))
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, sink):
+        """Wait until every queued chunk of `sink` is on disk, re-raising a write error."""
+        done = threading.Event()
+        self._queue_for(sink).put((_FLUSH, done, None, None))
+        done.wait()
+        error = self._errors.pop(id(sink), None)
+        if error is not None:
+            raise error
+
+    def committed(self, filename):
+        if self.fsync != "batch":
+            return
+        with self._lock:
+            self._unsynced.append(filename)
+            if len(self._unsynced) < self.fsync_batch:
+                return
+            batch, self._unsynced = self._unsynced, []
+        if self._threads:
+            self._queues[0].put((_SYNC, batch, None, None))
+        else:
+            fsync_files(batch)
+
+    def sync(self):
+        """fsync files finished since the last batch; call at the end of a run."""
+        with self._lock:
+            batch, self._unsynced = self._unsynced, []
+        if batch:
+            fsync_files(batch)
+
+    def close(self):
+        """Stop the writer threads once their queues are drained; a later write starts them again."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        for tasks in self._queues:
+            tasks.put((_STOP, None, None, None))
+        for thread in threads:
+            thread.join()
+
+    def _run(self, tasks):
+        while True:
+            sink, data, count, buffer = tasks.get()
+            if sink is _STOP:
+                return
+            if sink is _FLUSH:
+                data.set()
+                continue
+            if sink is _SYNC:
+                fsync_files(data)
+                continue
+            try:
+                if id(sink) not in self._errors:
+                    sink.write(memoryview(data)[:count] if count is not None else data)
+            except Exception as e:
+                self._errors[id(sink)] = e
+            finally:
+                if buffer is not None:
+                    self.buffers.release(buffer)
+
+
+def fsync_files(filenames):
+    folders = set()
+    for filename in filenames:
+        try:
+            fd = os.open(filename, os.O_RDWR if os.name == "nt" else os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        folders.add(os.path.dirname(filename))
+    if os.name == "nt":
+        # directories cannot be opened for fsync on Windows
+        return
+    for folder in folders:
+        try:
+            fd = os.open(folder or ".", os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
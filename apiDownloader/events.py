@@ -0,0 +1,57 @@
+import threading
+from collections import namedtuple
+
+THREAD_STARTED = "thread_started"
+THREAD_DONE = "thread_done"
+FILE_STARTED = "file_started"
+FILE_PROGRESS = "file_progress"
+FILE_DONE = "file_done"
+FILE_SKIPPED = "file_skipped"
+ERROR = "error"
+
+DownloadEvent = namedtuple(
+    "DownloadEvent",
+    ["kind", "thread_url", "file_url", "filename", "bytes", "total", "error", "failed"],
+    defaults=(None, None, None, 0, None, None, 0),
+)
+DownloadEvent.__doc__ = """A single step of the download pipeline.
+
+`bytes` is the chunk size for FILE_PROGRESS and the file size for
+FILE_DONE; `total` is the expected file size (FILE_STARTED/FILE_PROGRESS)
+or the number of files in a thread (THREAD_STARTED). `failed` is the
+number of files of a thread that could not be downloaded (THREAD_DONE).
+"""
+
+
+class EventBus:
+    """Fans events out to subscribers on whichever worker thread raised them.
+
+    Subscribers must be cheap and thread-safe; a GUI should hand events over
+    to its own thread instead of touching widgets here.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not callback]
+
+    def emit(self, kind, **fields):
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        event = DownloadEvent(kind, **fields)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Event subscriber failed on {kind}: {str(e)}")
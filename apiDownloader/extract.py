@@ -0,0 +1,182 @@
+import codecs
+import json
+import re
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+DVACH_THREAD_PATTERN = r"^(https?://[^/]+)/(\w+)/res/(\d+)\.(?:html|json)"
+
+
+def dvach_json_url(url):
+    match = re.search(DVACH_THREAD_PATTERN, url)
+    if not match:
+        return None
+    host, board, thread_id = match.groups()
+    return f"{host}/{board}/res/{thread_id}.json"
+
+
+def posts_from_json(data):
+    for thread in data.get("threads", []):
+        for post in thread.get("posts", []):
+            yield post
+
+
+class Extractor:
+    """Collects media hrefs from a page fed in chunks.
+
+    `feed()` accepts raw bytes as they arrive from the network and `close()`
+    returns the hrefs ending with one of `extensions`, in page order.
+    """
+
+    def __init__(self, extensions):
+        self.extensions = tuple(extensions)
+        self.sizes = {}
+
+    def feed(self, chunk):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def extract(self, content):
+        self.feed(content)
+        return self.close()
+
+
+class _LinkCollector(HTMLParser):
+    def __init__(self, extensions):
+        super().__init__()
+        self.extensions = extensions
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        for name, value in attrs:
+            if name == "href" and value and value.endswith(self.extensions):
+                self.links.append(value)
+
+
+class TokenizerExtractor(Extractor):
+    """Streaming html.parser tokenizer that keeps only matching <a href> values, no tree."""
+
+    def __init__(self, extensions):
+        super().__init__(extensions)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parser = _LinkCollector(self.extensions)
+
+    def feed(self, chunk):
+        self._parser.feed(self._decoder.decode(chunk))
+
+    def close(self):
+        self._parser.feed(self._decoder.decode(b"", final=True))
+        self._parser.close()
+        return self._parser.links
+
+
+class _LxmlTarget:
+    def __init__(self, extensions):
+        self.extensions = extensions
+        self.links = []
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href and href.endswith(self.extensions):
+                self.links.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return self.links
+
+
+class LxmlExtractor(Extractor):
+    """libxml2 push parser with a target that only records matching <a href> values."""
+
+    def __init__(self, extensions):
+        if etree is None:
+            raise ImportError("LxmlExtractor requires lxml: pip install lxml")
+        super().__init__(extensions)
+        self._parser = etree.HTMLParser(target=_LxmlTarget(self.extensions), encoding="utf-8")
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+    def close(self):
+        return self._parser.close()
+
+
+class SoupExtractor(Extractor):
+    """The original BeautifulSoup html.parser path, kept as a fallback."""
+
+    def __init__(self, extensions):
+        super().__init__(extensions)
+        self._chunks = []
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+
+    def close(self):
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(b"".join(self._chunks), "html.parser")
+        links = soup.find_all("a", href=lambda href: href and href.endswith(self.extensions))
+        return [link["href"] for link in links]
+
+
+class JsonExtractor(Extractor):
+    """Reads file paths straight from the 2ch `res/<id>.json` thread API.
+
+    Posts numbered `after_post` or lower are skipped; `last_post` holds the
+    highest post number seen once `close()` has run. `sizes` maps each path
+    to the size the API reports (in KB) converted to bytes.
+    """
+
+    def __init__(self, extensions, after_post=0):
+        super().__init__(extensions)
+        self.after_post = after_post
+        self.last_post = after_post
+        self._chunks = []
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+
+    def close(self):
+        data = json.loads(b"".join(self._chunks))
+        links = []
+        for post in posts_from_json(data):
+            num = post.get("num", 0)
+            if num <= self.after_post:
+                continue
+            self.last_post = max(self.last_post, num)
+            for file in post.get("files") or []:
+                path = file.get("path") or ""
+                if path.endswith(self.extensions):
+                    links.append(path)
+                    if file.get("size"):
+                        self.sizes[path] = file["size"] * 1024
+        return links
+
+
+EXTRACTORS = {
+    "tokenizer": TokenizerExtractor,
+    "lxml": LxmlExtractor,
+    "bs4": SoupExtractor,
+    "json": JsonExtractor,
+}
+
+
+def get_extractor(name, extensions):
+    if name in (None, "auto"):
+        name = "lxml" if etree is not None else "tokenizer"
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor: {name}")
+    return EXTRACTORS[name](extensions)
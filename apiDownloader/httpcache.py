@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+DEFAULT_LIMIT = 256 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+CachedPage = namedtuple("CachedPage", ["url", "etag", "last_modified", "immutable", "links", "sizes"])
+CachedPage.__doc__ = """A cached page version without its body; `links`/`sizes` are the
+parsed media links of exactly this version, or None if it was never parsed."""
+
+
+class PageCache:
+    """On-disk cache of thread pages and the media links parsed from them.
+
+    Bodies are stored zlib-compressed together with their ETag and
+    Last-Modified, so a known page is revalidated with a conditional
+    request. The parsed links are stored with the body they came from and
+    replaced together with it, so a 304 skips both the transfer and the
+    parsing. Pages stored as `immutable` (finished arhivach archives) are
+    never revalidated. Once the stored bodies exceed `limit` bytes the least
+    recently used pages are evicted.
+    """
+
+    def __init__(self, path, limit=DEFAULT_LIMIT):
+        self.path = path
+        self.limit = limit
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                immutable INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                links TEXT,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed);
+        """)
+        self._db.commit()
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if self.size > self.limit:
+            self._evict()
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified, immutable, links FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        etag, last_modified, immutable, links = row
+        links, sizes = json.loads(links) if links else (None, None)
+        return CachedPage(url, etag, last_modified, bool(immutable), links, sizes)
+
+    def body(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT body FROM pages WHERE url = ?", (url,)).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    @staticmethod
+    def validators(page):
+        headers = {}
+        if page.etag:
+            headers["If-None-Match"] = page.etag
+        if page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+        return headers
+
+    def put(self, url, headers, body, links=None, sizes=None, immutable=False):
+        """Store a 200 response; `body` is the compressed body from `compressor()`."""
+        if len(body) > self.limit:
+            return
+        parsed = json.dumps([links, sizes or {}]) if links is not None else None
+        with self._lock:
+            row = self._db.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, immutable, body, size, links, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, headers.get("ETag"), headers.get("Last-Modified"), int(immutable), body, len(body), parsed,
+                 time.time()))
+            self.size += len(body) - (row[0] if row else 0)
+            if self.size > self.limit:
+                self._evict()
+            self._db.commit()
+
+    def revalidated(self, url, headers, immutable=False):
+        """Record a 304: the validators may have been refreshed and the page may now be final."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+                "immutable = MAX(immutable, ?), accessed = ? WHERE url = ?",
+                (headers.get("ETag"), headers.get("Last-Modified"), int(immutable), time.time(), url))
+            self._db.commit()
+
+    def remove(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._db.commit()
+                self.size -= row[0]
+
+    def _evict(self):
+        # down to 90% of the limit, so the next few pages do not evict again
+        target = self.limit * 0.9
+        rows = self._db.execute("SELECT url, size FROM pages ORDER BY accessed").fetchall()
+        for url, size in rows:
+            if self.size <= target:
+                break
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self.size -= size
+
+
+def compressor():
+    return zlib.compressobj(COMPRESS_LEVEL)
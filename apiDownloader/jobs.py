@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+SCANNED = "scanned"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """Durable record of queued threads and their files.
+
+    A thread is `pending` until its page has been parsed, `scanned` once its
+    file list is stored and `done` when every file has been downloaded. After
+    a restart scanned threads are resumed from the stored file list without
+    fetching the page again; failed files are retried.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS threads (
+                url TEXT PRIMARY KEY,
+                output_path TEXT NOT NULL,
+                host_type TEXT NOT NULL,
+                state TEXT NOT NULL,
+                added REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                thread_url TEXT NOT NULL,
+                link TEXT NOT NULL,
+                size INTEGER,
+                state TEXT NOT NULL,
+                PRIMARY KEY (thread_url, link)
+            );
+        """)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add_all(self, threads, reopen=True):
+        """Queue `(url, output_path, host_type)` jobs.
+
+        With `reopen` a finished thread is queued again and its page is
+        rescanned for new files.
+        """
+        with self._lock:
+            for url, output_path, host_type in threads:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO threads (url, output_path, host_type, state, added) VALUES (?, ?, ?, ?, ?)",
+                    (url, output_path, host_type, PENDING, time.time()))
+                if reopen:
+                    self._db.execute("UPDATE threads SET state = ? WHERE url = ? AND state = ?", (PENDING, url, DONE))
+            self._db.commit()
+
+    def unfinished(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT url, output_path, host_type FROM threads WHERE state != ? ORDER BY added", (DONE,)).fetchall()
+
+    def known_links(self, url):
+        """Return `(links, sizes)` still to download, or None if the thread was never scanned."""
+        with self._lock:
+            row = self._db.execute("SELECT state FROM threads WHERE url = ?", (url,)).fetchone()
+            if not row or row[0] != SCANNED:
+                return None
+            rows = self._db.execute(
+                "SELECT link, size FROM files WHERE thread_url = ? AND state != ?", (url, DONE)).fetchall()
+        return [link for link, _ in rows], {link: size for link, size in rows if size is not None}
+
+    def record_links(self, url, links, sizes):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO files (thread_url, link, size, state) VALUES (?, ?, ?, ?)",
+                [(url, link, sizes.get(link), PENDING) for link in links])
+            self._db.execute("UPDATE threads SET state = ? WHERE url = ?", (SCANNED, url))
+            self._db.commit()
+
+    def file_finished(self, url, link, ok):
+        with self._lock:
+            self._db.execute("UPDATE files SET state = ? WHERE thread_url = ? AND link = ?",
+                             (DONE if ok else FAILED, url, link))
+            self._db.commit()
+
+    def thread_finished(self, url):
+        # a thread with failed files stays queued for the next run
+        with self._lock:
+            failed = self._db.execute("SELECT COUNT(*) FROM files WHERE thread_url = ? AND state != ?",
+                                      (url, DONE)).fetchone()[0]
+            if not failed:
+                self._db.execute("UPDATE threads SET state = ? WHERE url = ?", (DONE, url))
+                self._db.commit()
+            return not failed
+
+    def stats(self):
+        with self._lock:
+            threads = dict(self._db.execute("SELECT state, COUNT(*) FROM threads GROUP BY state").fetchall())
+            files = dict(self._db.execute("SELECT state, COUNT(*) FROM files GROUP BY state").fetchall())
+        return {"threads": threads, "files": files}
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST_FILE = ".manifest.jsonl"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class Manifest:
+    """Per-thread record of finished files, kept next to `images`/`videos`.
+
+    Every entry holds the file URL, the link it came from, size, content
+    hash, ETag and the time it was finished, keyed by the path relative to
+    the thread folder. The file is read once when the thread is first
+    touched; afterwards "is this file done" is a dict lookup. New entries are
+    appended one JSON line each, so recording a file never rewrites the whole
+    manifest and a line torn by a crash is simply ignored on the next load.
+    `compact()` rewrites it with one line per file. Entries recorded with
+    `verified=False` (files found on disk, not downloaded by a `FileSink`)
+    carry `"unverified": true` until their size is checked against the server.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.entries = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._lines += 1
+                    if entry.get("removed"):
+                        self.entries.pop(entry.get("name"), None)
+                    elif entry.get("name"):
+                        self.entries[entry["name"]] = entry
+        except FileNotFoundError:
+            pass
+
+    def name_for(self, filename):
+        return os.path.relpath(filename, self.folder).replace(os.sep, "/")
+
+    def filename_for(self, name):
+        return os.path.join(self.folder, *name.split("/"))
+
+    def get(self, filename):
+        return self.entries.get(self.name_for(filename))
+
+    def __contains__(self, filename):
+        return self.name_for(filename) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, filename, url, link, size, digest=None, etag=None, verified=True):
+        entry = {"name": self.name_for(filename), "url": url, "link": link, "size": size, "hash": digest,
+                 "etag": etag, "time": time.time()}
+        if not verified:
+            entry["unverified"] = True
+        with self._lock:
+            self.entries[entry["name"]] = entry
+            self._append(entry)
+        return entry
+
+    def remove(self, filename):
+        name = self.name_for(filename)
+        with self._lock:
+            if self.entries.pop(name, None) is not None:
+                self._append({"name": name, "removed": True})
+
+    def _append(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._lines += 1
+
+    def compact(self):
+        """Rewrite the manifest with one line per file if it has grown stale lines."""
+        with self._lock:
+            if self._lines <= len(self.entries):
+                return
+            temp = self.path + ".tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temp, self.path)
+            self._lines = len(self.entries)
+
+
+def check_file(filename, size, digest, hash_name):
+    """Re-hash one file; runs in a worker process.
+
+    Returns `(filename, ok, digest)`: `ok` is False when the file is missing,
+    has the wrong size or, where the manifest knows its hash, different
+    content. Entries recorded without a hash only get the size check, and
+    the returned digest lets the caller fill it in.
+    """
+    try:
+        if size is not None and os.path.getsize(filename) != size:
+            return filename, False, None
+        hasher = hashlib.new(hash_name)
+        buffer = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(filename, "rb") as f:
+            while True:
+                count = f.readinto(view)
+                if not count:
+                    break
+                hasher.update(view[:count])
+    except OSError:
+        return filename, False, None
+    actual = hasher.hexdigest()
+    return filename, digest is None or actual == digest, actual
+
+
+def verify_manifests(manifests, hash_name, processes=None):
+    """Check every entry of `manifests` on a process pool.
+
+    Hashing is CPU bound, so processes instead of threads let it use every
+    core. Failed entries are removed from their manifest and their broken
+    files deleted; returns `{manifest: [entry, ...]}` for the failed ones so
+    they can be downloaded again.
+    """
+    by_filename = {}
+    for manifest in manifests:
+        for entry in list(manifest.entries.values()):
+            by_filename[manifest.filename_for(entry["name"])] = manifest, entry
+    failed = {}
+    if not by_filename:
+        return failed
+    args = [(filename, entry.get("size"), entry.get("hash"), hash_name)
+            for filename, (manifest, entry) in by_filename.items()]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = pool.map(_check_args, args, chunksize=max(1, len(args) // (4 * (processes or os.cpu_count() or 1))))
+        for filename, ok, digest in results:
+            manifest, entry = by_filename[filename]
+            if ok:
+                if entry.get("hash") is None:
+                    manifest.record(filename, entry.get("url"), entry.get("link"), entry.get("size"), digest,
+                                    entry.get("etag"), not entry.get("unverified"))
+                continue
+            manifest.remove(filename)
+            if os.path.exists(filename):
+                os.remove(filename)
+            failed.setdefault(manifest, []).append(entry)
+    for manifest in manifests:
+        manifest.compact()
+    return failed
+
+
+def _check_args(args):
+    return check_file(*args)
@@ -0,0 +1,229 @@
+import bisect
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from . import events
+
+PREFIX = "apidownloader_"
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+Span = namedtuple("Span", ["name", "start", "duration", "attributes", "error"])
+Span.__doc__ = """A finished span: `start` is wall-clock time, `duration` in seconds,
+`error` the exception that ended it or None."""
+
+
+def host_of(url):
+    return urlsplit(url).netloc if url else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, lock):
+        self.name = name
+        self.help = help
+        self._lock = lock
+        self._values = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, lock, buckets=TIME_BUCKETS):
+        super().__init__(name, help, lock)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one slot per bucket plus +Inf, then sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        for key, counts in self._values.items():
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            samples.append({"labels": dict(key), "count": cumulative, "sum": counts[-1], "buckets": buckets})
+        return samples
+
+
+class Metrics:
+    """Counters, gauges and histograms for one or more downloaders.
+
+    Stage timings go to `stage_seconds{stage=...}`: `page` is a whole page
+    fetch including `parse`, `file` a whole file download including
+    `disk_write`, so the difference of each pair is time spent on the
+    network. Span hooks are called with a `Span` after every timed stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+        self._span_hooks = []
+        self.files = self.counter("files_total", "Files handled, by result")
+        self.bytes = self.counter("bytes_downloaded_total", "Bytes received for files, by host")
+        self.requests = self.counter("requests_total", "HTTP requests, by host and outcome")
+        self.retries = self.counter("retries_total", "Retried HTTP requests, by host")
+        self.latency = self.histogram("request_ttfb_seconds", "Time to response headers, by host")
+        self.stages = self.histogram("stage_seconds", "Time spent per pipeline stage")
+        self.queue_depth = self.gauge("file_queue_depth", "Files waiting for a worker")
+        self.workers = self.gauge("workers", "File workers")
+        self.workers_busy = self.gauge("workers_busy", "File workers currently busy")
+        self.host_limit = self.gauge("host_concurrency_limit", "Adaptive concurrency window, by host")
+        self.host_in_flight = self.gauge("host_in_flight", "Requests in flight, by host")
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help=""):
+        return self._register(Counter(name, help, threading.Lock()))
+
+    def gauge(self, name, help=""):
+        return self._register(Gauge(name, help, threading.Lock()))
+
+    def histogram(self, name, help="", buckets=TIME_BUCKETS):
+        return self._register(Histogram(name, help, threading.Lock(), buckets))
+
+    def add_collector(self, callback):
+        """`callback()` runs before every snapshot to refresh gauges."""
+        self._collectors.append(callback)
+
+    def add_span_hook(self, hook):
+        self._span_hooks.append(hook)
+        return hook
+
+    def remove_span_hook(self, hook):
+        self._span_hooks = [h for h in self._span_hooks if h is not hook]
+
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.stages.observe(duration, stage=name)
+            if self._span_hooks:
+                span = Span(name, start, duration, attributes, error)
+                for hook in self._span_hooks:
+                    hook(span)
+
+    def on_event(self, event):
+        if event.kind == events.FILE_PROGRESS:
+            self.bytes.inc(event.bytes, host=host_of(event.file_url))
+        elif event.kind == events.FILE_DONE:
+            self.files.inc(result="done")
+        elif event.kind == events.FILE_SKIPPED:
+            self.files.inc(result="skipped")
+        elif event.kind == events.ERROR and event.file_url:
+            self.files.inc(result="error")
+
+    def snapshot(self):
+        for collect in self._collectors:
+            collect()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            with metric._lock:
+                snapshot[metric.name] = {"type": metric.kind, "help": metric.help, "samples": metric.samples()}
+        return snapshot
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric in self.snapshot().items():
+            name = PREFIX + name
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for sample in metric["samples"]:
+                labels = sample["labels"]
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {sample['value']}")
+                    continue
+                for bound, count in sample["buckets"].items():
+                    le = "+Inf" if bound == "inf" else bound
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {sample['sum']}")
+                lines.append(f"{name}_count{_labels(labels)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        """Serve `/metrics` (Prometheus text) and `/metrics.json` on a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics.to_json().encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
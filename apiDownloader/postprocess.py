@@ -0,0 +1,302 @@
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from . import events
+
+MEDIA_INDEX_FILE = ".media.sqlite"
+THUMBNAILS_DIR = ".thumbnails"
+THUMBNAIL_SIZE = 96
+# dHash bits that may differ between two near-identical images
+PHASH_DISTANCE = 4
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".gif")
+VIDEO_EXT = (".mp4", ".webm")
+FFMPEG_TIMEOUT = 60
+
+
+def image_size(path):
+    """Width and height from the PNG, GIF or JPEG header, without decoding the image."""
+    with open(path, "rb") as f:
+        head = f.read(26)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if not head.startswith(b"\xff\xd8"):
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                return None
+            length = struct.unpack(">H", marker[2:4])[0]
+            # SOF0..SOF15 carry the frame size, except DHT, JPG and DAC
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", f.read(5)[1:5])
+                return width, height
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def difference_hash(image):
+    """64-bit dHash: brightness gradients of a 9x8 grey thumbnail, robust to rescaling and recompression."""
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            bits = bits << 1 | (left > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+
+def hamming(first, second):
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+
+def probe_video(path):
+    """`(width, height, duration)` from ffprobe, or Nones if it is not installed."""
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return None, None, None
+    try:
+        output = subprocess.run([ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries",
+                                 "stream=width,height:format=duration", "-of", "json", path],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=FFMPEG_TIMEOUT).stdout
+        info = json.loads(output or b"{}")
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None, None, None
+    stream = (info.get("streams") or [{}])[0]
+    duration = (info.get("format") or {}).get("duration")
+    return stream.get("width"), stream.get("height"), float(duration) if duration else None
+
+
+def video_thumbnail(path, thumbnail, size):
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return False
+    try:
+        subprocess.run([ffmpeg, "-loglevel", "error", "-y", "-ss", "1", "-i", path, "-frames:v", "1",
+                        "-vf", f"scale={size}:{size}:force_original_aspect_ratio=decrease", thumbnail],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=FFMPEG_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return os.path.exists(thumbnail)
+
+
+def process_file(path, thumbnail_size=THUMBNAIL_SIZE):
+    """Collect metadata for one media file; runs in a worker process.
+
+    Thumbnails go to `<thread>/.thumbnails/<name>.png`. Decoding images,
+    the thumbnail and the perceptual hash need Pillow; without it only
+    the header dimensions are read. Videos use ffprobe/ffmpeg when they
+    are on PATH.
+    """
+    folder = os.path.dirname(os.path.dirname(path))
+    stat = os.stat(path)
+    record = {"name": os.path.relpath(path, folder).replace(os.sep, "/"), "size": stat.st_size,
+              "mtime": stat.st_mtime, "kind": None, "width": None, "height": None, "duration": None,
+              "phash": None, "thumbnail": None}
+    thumbnail = os.path.join(folder, THUMBNAILS_DIR, os.path.basename(path) + ".png")
+    os.makedirs(os.path.dirname(thumbnail), exist_ok=True)
+    lower = path.lower()
+    if lower.endswith(VIDEO_EXT):
+        record["kind"] = "video"
+        record["width"], record["height"], record["duration"] = probe_video(path)
+        if video_thumbnail(path, thumbnail, thumbnail_size):
+            record["thumbnail"] = os.path.relpath(thumbnail, folder).replace(os.sep, "/")
+    elif lower.endswith(IMAGE_EXT):
+        record["kind"] = "image"
+        try:
+            if Image is None:
+                record["width"], record["height"] = image_size(path) or (None, None)
+            else:
+                with Image.open(path) as image:
+                    record["width"], record["height"] = image.size
+                    record["phash"] = difference_hash(image)
+                    image.thumbnail((thumbnail_size, thumbnail_size))
+                    image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB").save(thumbnail, "PNG")
+                    record["thumbnail"] = os.path.relpath(thumbnail, folder).replace(os.sep, "/")
+        except (OSError, ValueError, struct.error, SyntaxError):
+            # truncated or not really an image: keep the record without metadata
+            pass
+    return folder, record
+
+
+class MediaIndex:
+    """Per-thread SQLite index of processed media, next to `images`/`videos`.
+
+    `MediaViewer` lists a thread from here instead of walking its folders.
+    Near-identical images (dHash within `PHASH_DISTANCE` bits) keep their
+    file but point `duplicate_of` at the first copy, so viewers can hide
+    them.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MEDIA_INDEX_FILE)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS media (
+                name TEXT PRIMARY KEY,
+                kind TEXT,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                duration REAL,
+                phash TEXT,
+                thumbnail TEXT,
+                duplicate_of TEXT,
+                added REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+        self._known = {name: (size, mtime) for name, size, mtime in
+                       self._db.execute("SELECT name, size, mtime FROM media")}
+        self._hashes = self._db.execute(
+            "SELECT name, phash FROM media WHERE phash IS NOT NULL AND duplicate_of IS NULL").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def is_current(self, name, size, mtime):
+        return self._known.get(name) == (size, mtime)
+
+    def add(self, record):
+        with self._lock:
+            duplicate_of = None
+            if record["phash"]:
+                duplicate_of = next((name for name, phash in self._hashes
+                                     if name != record["name"] and hamming(phash, record["phash"]) <= PHASH_DISTANCE),
+                                    None)
+                if duplicate_of is None:
+                    self._hashes.append((record["name"], record["phash"]))
+            self._db.execute(
+                "INSERT OR REPLACE INTO media (name, kind, size, mtime, width, height, duration, phash, thumbnail, "
+                "duplicate_of, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["name"], record["kind"], record["size"], record["mtime"], record["width"], record["height"],
+                 record["duration"], record["phash"], record["thumbnail"], duplicate_of, time.time()))
+            self._db.commit()
+            self._known[record["name"]] = (record["size"], record["mtime"])
+        return duplicate_of
+
+    def search(self, text=None, kind=None, min_width=None, duplicates=False):
+        """Index rows as dicts, filtered by name substring, kind and minimum width."""
+        query = "SELECT * FROM media WHERE 1 = 1"
+        params = []
+        if text:
+            query += " AND name LIKE ?"
+            params.append(f"%{text}%")
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if min_width:
+            query += " AND width >= ?"
+            params.append(min_width)
+        if not duplicates:
+            query += " AND duplicate_of IS NULL"
+        with self._lock:
+            cursor = self._db.execute(query + " ORDER BY name", params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class PostProcessor:
+    """Runs thumbnails, dimensions, durations and perceptual hashing for finished files.
+
+    Subscribe it to a downloader (`Downloader(postprocess=...)`) and every
+    FILE_DONE, and every FILE_SKIPPED file missing from its thread's index,
+    is handed to a process pool right away, so processing overlaps with the
+    downloads still running. Results land in each thread's `MediaIndex`.
+    Worker processes are spawned rather than forked because the downloader
+    is multi-threaded when they start.
+    """
+
+    def __init__(self, workers=None, thumbnail_size=THUMBNAIL_SIZE, logger=None):
+        self.workers = workers
+        self.thumbnail_size = thumbnail_size
+        self.logger = logger
+        self.indexes = {}
+        self.processed = 0
+        self._pool = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _index_for(self, folder):
+        with self._lock:
+            index = self.indexes.get(folder)
+            if index is None:
+                index = self.indexes[folder] = MediaIndex(folder)
+            return index
+
+    def on_event(self, event):
+        if event.kind not in (events.FILE_DONE, events.FILE_SKIPPED) or not event.filename:
+            return
+        if not event.filename.lower().endswith(IMAGE_EXT + VIDEO_EXT):
+            return
+        if event.kind == events.FILE_SKIPPED:
+            folder = os.path.dirname(os.path.dirname(event.filename))
+            try:
+                stat = os.stat(event.filename)
+            except OSError:
+                return
+            name = os.path.relpath(event.filename, folder).replace(os.sep, "/")
+            if self._index_for(folder).is_current(name, stat.st_size, stat.st_mtime):
+                return
+        self.submit(event.filename)
+
+    def submit(self, filename):
+        with self._lock:
+            if filename in self._pending:
+                return
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._pending.add(filename)
+            future = self._pool.submit(process_file, filename, self.thumbnail_size)
+        future.add_done_callback(lambda f: self._done(filename, f))
+
+    def _done(self, filename, future):
+        try:
+            folder, record = future.result()
+            duplicate_of = self._index_for(folder).add(record)
+            if duplicate_of and self.logger:
+                self.logger.info(f"{filename} is a near-duplicate of {duplicate_of}")
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Post-processing failed for {filename}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(filename)
+                self.processed += 1
+                self._idle.notify_all()
+
+    def wait(self):
+        """Block until every submitted file is processed."""
+        with self._lock:
+            while self._pending:
+                self._idle.wait()
+
+    def close(self):
+        self.wait()
+        with self._lock:
+            pool, self._pool = self._pool, None
+            indexes, self.indexes = self.indexes, {}
+        if pool is not None:
+            pool.shutdown()
+        for index in indexes.values():
+            index.close()
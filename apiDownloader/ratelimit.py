@@ -0,0 +1,201 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+OVERLOAD_STATUSES = (429, 503)
+LATENCY_TOLERANCE = 2.0
+LATENCY_FLOOR = 0.05
+DECREASE_COOLDOWN = 1.0
+POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """Classic token bucket; `reserve()` takes tokens now and returns how long to wait for them."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.rate = float(rate)
+            if burst is not None:
+                self.burst = float(burst)
+                self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+
+class Lease:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self.latency = None
+
+    def start(self):
+        self.started = time.monotonic()
+
+    def responded(self):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+    def release(self, overloaded=False, retry_after=None):
+        self.limiter._release(self, overloaded, retry_after)
+
+
+class HostLimiter:
+    """Request rate and concurrency control for one host.
+
+    The optional token bucket caps requests per second. The number of
+    requests in flight is an AIMD window: every healthy response (one whose
+    time to headers stays within `LATENCY_TOLERANCE` of the fastest seen)
+    grows it by 1/window, roughly +1 per round of requests, and a 429, 5xx
+    or timeout halves it, at most once per `DECREASE_COOLDOWN`. Retry-After
+    pauses the whole host.
+    """
+
+    def __init__(self, rate=None, burst=None, adaptive=True, min_concurrency=1, max_concurrency=8,
+                 initial_concurrency=2):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.adaptive = adaptive
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency)
+                           if adaptive else max_concurrency)
+        self.in_flight = 0
+        self.min_latency = None
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _try_lease_locked(self):
+        now = time.monotonic()
+        if now < self._paused_until:
+            return None, self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None, None
+        wait = self.bucket.reserve() if self.bucket else 0.0
+        self.in_flight += 1
+        return Lease(self), wait
+
+    def try_lease(self):
+        with self._condition:
+            return self._try_lease_locked()
+
+    def lease(self):
+        with self._condition:
+            while True:
+                lease, wait = self._try_lease_locked()
+                if lease:
+                    break
+                self._condition.wait(wait)
+        if wait:
+            time.sleep(wait)
+        lease.start()
+        return lease
+
+    async def lease_async(self):
+        while True:
+            lease, wait = self.try_lease()
+            if lease:
+                if wait:
+                    await asyncio.sleep(wait)
+                lease.start()
+                return lease
+            await asyncio.sleep(wait or POLL_INTERVAL)
+
+    def _release(self, lease, overloaded, retry_after):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if overloaded:
+                if self.adaptive and now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            elif lease.latency is not None:
+                if self.min_latency is None or lease.latency < self.min_latency:
+                    self.min_latency = lease.latency
+                healthy = lease.latency <= LATENCY_TOLERANCE * self.min_latency + LATENCY_FLOOR
+                if self.adaptive and healthy:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class HostLimits:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter(**self.kwargs)
+            return self._hosts[host]
+
+    def snapshot(self):
+        with self._lock:
+            return {host: {"limit": limiter.limit, "in_flight": limiter.in_flight}
+                    for host, limiter in self._hosts.items()}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that never waits less than Retry-After."""
+
+    def __init__(self, retries=2, base_delay=0.5, max_delay=60.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt, transient):
+        return transient and attempt < self.retries
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+def describe_status(status, headers):
+    """Returns (transient, overloaded, retry_after) for an HTTP error status."""
+    retry_after = retry_after_seconds(headers.get("Retry-After"))
+    return status in RETRY_STATUSES, status in OVERLOAD_STATUSES or status >= 500, retry_after
+
+
+def retry_after_seconds(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
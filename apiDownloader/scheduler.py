@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import IMAGE_EXT, events
+
+PRIORITIES = ("images_first", "smallest_first", "fifo")
+
+
+def priority_for(link, size, policy):
+    if policy == "images_first":
+        return 0 if link.endswith(tuple(IMAGE_EXT)) else 1
+    elif policy == "smallest_first":
+        if size is not None:
+            return size
+        # without a known size images are still the better guess for "small"
+        return 0 if link.endswith(tuple(IMAGE_EXT)) else float("inf")
+    return 0
+
+
+class FairQueue:
+    """Blocking queue of file tasks that round-robins between threads.
+
+    Each thread has its own priority heap; `get()` takes the best task of the
+    next thread in turn, so a thread with 1000 webms cannot hold back a thread
+    with 10 images that was queued after it.
+    """
+
+    def __init__(self):
+        self._heaps = OrderedDict()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, key, priority, task):
+        with self._condition:
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (priority, next(self._counter), task))
+            self._condition.notify()
+
+    def get(self):
+        with self._condition:
+            while not self._heaps:
+                if self._closed:
+                    return None
+                self._condition.wait()
+            key, heap = self._heaps.popitem(last=False)
+            _, _, task = heapq.heappop(heap)
+            if heap:
+                self._heaps[key] = heap
+            return task
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(heap) for heap in self._heaps.values())
+
+
+class Scheduler:
+    """Runs a whole batch of threads through one long-lived set of workers.
+
+    Pages are fetched and parsed on `page_workers` threads while
+    `downloader.max_workers` file workers drain a single `FairQueue`, so the
+    files of one thread are downloading while the next page is still being
+    parsed. With a `JobQueue` every scanned file list and finished file is
+    recorded, so an interrupted batch resumes where it stopped. `links` maps
+    thread URLs to `(links, sizes)` that are queued without fetching the page.
+    """
+
+    def __init__(self, downloader, page_workers=4, priority="images_first", jobs=None, links=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.downloader = downloader
+        self.logger = downloader.logger
+        self.page_workers = page_workers
+        self.priority = priority
+        self.jobs = jobs
+        self.links = links or {}
+        self.queue = FairQueue()
+        self._remaining = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def run(self, threads):
+        self.downloader.metrics.workers.set(self.downloader.max_workers)
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.downloader.max_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.page_workers) as pages:
+                for url, output_path, host_type in threads:
+                    if self.downloader.stopped.is_set():
+                        break
+                    pages.submit(self._enqueue_thread, url, output_path, host_type)
+        except BaseException:
+            # Ctrl+C in the main thread: let the workers exit instead of draining the queue
+            self.downloader.stop()
+            raise
+        finally:
+            self.queue.close()
+            for worker in workers:
+                worker.join()
+            self.downloader._finish_run()
+
+    def _enqueue_thread(self, url, output_path, host_type):
+        if self.downloader.stopped.is_set():
+            return
+        try:
+            links, sizes = self._links_for(url, host_type)
+            # pages link an attachment from its thumbnail and its file name
+            links = list(dict.fromkeys(links))
+            self.downloader._ensure_folder(output_path)
+            self.downloader.events.emit(events.THREAD_STARTED, thread_url=url, total=len(links))
+            if not links:
+                self._thread_done(url)
+                return
+            with self._lock:
+                self._remaining[url] = len(links)
+            for link in links:
+                priority = priority_for(link, sizes.get(link), self.priority)
+                self.queue.put(url, priority, (url, link, output_path, host_type))
+            self.downloader.metrics.queue_depth.set(len(self.queue))
+        except Exception as e:
+            self.logger.error(f"An error occurred while fetching {url}: {str(e)}")
+            self.downloader.events.emit(events.ERROR, thread_url=url, error=str(e))
+
+    def _links_for(self, url, host_type):
+        if url in self.links:
+            return self.links[url]
+        if self.jobs is not None:
+            known = self.jobs.known_links(url)
+            if known is not None:
+                return known
+        links, sizes = self.downloader._extract_page(url, host_type)
+        if self.jobs is not None:
+            self.jobs.record_links(url, links, sizes)
+        return links, sizes
+
+    def _thread_done(self, url):
+        with self._lock:
+            failed = self._failed.pop(url, 0)
+        if self.jobs is not None:
+            self.jobs.thread_finished(url)
+        self.downloader._log_thread_done(url, failed)
+        self.downloader.events.emit(events.THREAD_DONE, thread_url=url, failed=failed)
+
+    def _work(self):
+        metrics = self.downloader.metrics
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            metrics.queue_depth.set(len(self.queue))
+            url, link, output_path, host_type = task
+            if self.downloader.stopped.is_set():
+                # dropped files stay pending in the job queue for the next run
+                continue
+            ok = False
+            metrics.workers_busy.inc()
+            try:
+                ok = self.downloader.download_file(link, output_path, host_type, url)
+            finally:
+                metrics.workers_busy.inc(-1)
+                if self.jobs is not None:
+                    self.jobs.file_finished(url, link, ok)
+                with self._lock:
+                    if not ok:
+                        self._failed[url] = self._failed.get(url, 0) + 1
+                    self._remaining[url] -= 1
+                    done = not self._remaining[url]
+                if done:
+                    self._thread_done(url)
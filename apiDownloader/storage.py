@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+PART_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".json"
+# how often a preallocated part file records how much of it is real data; a
+# killed process never reaches abort(), so this is all a resume has to go on
+CHECKPOINT_BYTES = 1024 * 1024
+CHECKPOINT_SECONDS = 1.0
+
+_buffers = threading.local()
+
+
+def chunk_buffer(chunk_size):
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = bytearray(chunk_size)
+        _buffers.buffer = buffer
+    return buffer
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class IncompleteDownload(IOError):
+    pass
+
+
+class FileSink:
+    """Writes a download to `<filename>.part` and renames it into place on commit.
+
+    The final name only appears once every byte has been written, so a crash
+    never leaves a truncated file behind that would later be skipped as
+    already downloaded. An interrupted `.part` file is kept together with a
+    `<filename>.part.json` journal holding the expected size and the
+    ETag/Last-Modified validators, so the next attempt can ask the server
+    for the missing bytes only.
+
+    With `preallocate` the part file is extended to Content-Length up front;
+    its real length is then checkpointed in the journal every
+    `CHECKPOINT_BYTES` or `CHECKPOINT_SECONDS`, whichever comes first.
+    With `fsync` the data is flushed to disk before the rename.
+    """
+
+    def __init__(self, filename, url=None, hash_name=None, preallocate=False, fsync=False, part_exists=None):
+        self.filename = filename
+        self.url = url
+        self.hash_name = hash_name
+        self.preallocate = preallocate
+        self.fsync = fsync
+        self.preallocated = False
+        # False when the caller already knows there is no part file, saving a stat
+        self._part_may_exist = part_exists is not False
+        self._journal = None
+        self._checkpoint = 0
+        self._checkpoint_time = 0.0
+        self.hasher = None
+        self.etag = None
+        self.part_filename = filename + PART_SUFFIX
+        self.journal_filename = self.part_filename + JOURNAL_SUFFIX
+        self.offset = 0
+        self.expected_size = None
+        self.bytes_written = 0
+        # time spent in file writes and the final rename, across attempts
+        self.write_seconds = 0.0
+        self._file = None
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_filename, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_journal(self, journal):
+        with open(self.journal_filename, "w") as f:
+            json.dump(journal, f)
+
+    def resume_headers(self):
+        self.offset = 0
+        self.bytes_written = 0
+        if not self._part_may_exist or not os.path.exists(self.part_filename):
+            return {}
+        journal = self._read_journal()
+        if not journal or journal.get("url") != self.url:
+            self.discard()
+            return {}
+        offset = os.path.getsize(self.part_filename)
+        if journal.get("preallocated"):
+            offset = min(offset, journal.get("written", 0))
+        if not offset:
+            return {}
+        headers = {"Range": f"bytes={offset}-", "Accept-Encoding": "identity"}
+        etag = journal.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["If-Range"] = etag
+        elif journal.get("last_modified"):
+            headers["If-Range"] = journal["last_modified"]
+        self.offset = offset
+        return headers
+
+    @property
+    def digest(self):
+        return self.hasher.hexdigest() if self.hasher else None
+
+    def _hash_existing_part(self):
+        buffer = chunk_buffer(DEFAULT_CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(self.part_filename, "rb") as f:
+            while True:
+                count = f.readinto(view)
+                if not count:
+                    break
+                self.hasher.update(view[:count])
+
+    def begin(self, status, headers):
+        self._part_may_exist = True
+        self.hasher = hashlib.new(self.hash_name) if self.hash_name else None
+        self.etag = headers.get("ETag")
+        if status == 416:
+            self.discard()
+            raise RangeNotSatisfiable(f"Server rejected resume of {self.filename}")
+        content_range = headers.get("Content-Range")
+        if status == 206 and self.offset and content_range:
+            start, total = _parse_content_range(content_range)
+            if start != self.offset:
+                self.discard()
+                raise RangeNotSatisfiable(f"Server returned bytes from {start} instead of {self.offset}")
+            self.expected_size = total
+            self._file = open(self.part_filename, "r+b")
+            # a preallocated part is longer than the data written so far
+            self._file.truncate(self.offset)
+            if self.hasher:
+                self._hash_existing_part()
+            self._file.seek(self.offset)
+        else:
+            # the server ignored Range or the file changed: start over
+            self.offset = 0
+            content_length = headers.get("Content-Length")
+            encoded = headers.get("Content-Encoding", "identity") != "identity"
+            self.expected_size = int(content_length) if content_length and not encoded else None
+            self._file = open(self.part_filename, "wb")
+        self.preallocated = bool(self.preallocate and self.expected_size) and _preallocate(
+            self._file, self.expected_size)
+        self._journal = {
+            "url": self.url,
+            "size": self.expected_size,
+            "etag": self.etag,
+            "last_modified": headers.get("Last-Modified"),
+            "preallocated": self.preallocated,
+            "written": self.offset,
+        }
+        self._checkpoint = 0
+        self._checkpoint_time = time.monotonic()
+        self._write_journal(self._journal)
+        return self
+
+    def _save_checkpoint(self):
+        self._file.flush()
+        self._journal["written"] = self.offset + self.bytes_written
+        self._write_journal(self._journal)
+        self._checkpoint = self.bytes_written
+        self._checkpoint_time = time.monotonic()
+
+    def write(self, data):
+        started = time.perf_counter()
+        self._file.write(data)
+        self.write_seconds += time.perf_counter() - started
+        if self.hasher:
+            self.hasher.update(data)
+        self.bytes_written += len(data)
+        if self.preallocated and (self.bytes_written - self._checkpoint >= CHECKPOINT_BYTES
+                                  or time.monotonic() - self._checkpoint_time >= CHECKPOINT_SECONDS):
+            self._save_checkpoint()
+
+    def commit(self):
+        started = time.perf_counter()
+        size = self.offset + self.bytes_written
+        if self.expected_size is not None and size != self.expected_size:
+            self.abort()
+            raise IncompleteDownload(f"Incomplete download of {self.filename}: {size} of {self.expected_size} bytes")
+        if self.fsync:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self.part_filename, self.filename)
+        self.write_seconds += time.perf_counter() - started
+        if os.path.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+
+    def abort(self):
+        if self._file is not None:
+            if self.preallocated:
+                self._save_checkpoint()
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.abort()
+        self.offset = 0
+        for name in (self.part_filename, self.journal_filename):
+            if os.path.exists(name):
+                os.remove(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+def _preallocate(file, size):
+    """Reserve `size` bytes for `file`; False where the filesystem cannot."""
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(file.fileno(), 0, size)
+        else:
+            file.truncate(size)
+        return True
+    except OSError:
+        return False
+
+
+def _parse_content_range(value):
+    # "bytes 100-199/200" or "bytes 100-199/*"
+    units, _, spec = value.partition(" ")
+    byte_range, _, total = spec.partition("/")
+    start = int(byte_range.split("-")[0])
+    return start, (int(total) if total.isdigit() else None)
+
+
+def copy_response(response, sink, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, writer=None, throttle=None):
+    """Streams a `requests` response opened with `stream=True` into `sink`.
+
+    Chunks are read into one buffer per worker thread, so memory stays at
+    `chunk_size` per worker no matter how large the file is. With a
+    `WriterPool` the chunks are read into the pool's buffers instead and
+    written by its disk threads while this one goes back to the socket.
+    `progress` is called with the size of every chunk received and
+    `throttle` with the same size before the next read, so it can hold the
+    download back by sleeping.
+    """
+    raw = response.raw
+    raw.decode_content = True
+    if writer is not None:
+        try:
+            while True:
+                buffer = writer.buffers.acquire()
+                count = raw.readinto(buffer)
+                if not count:
+                    writer.buffers.release(buffer)
+                    break
+                writer.write(sink, buffer, count, buffer)
+                if progress:
+                    progress(count)
+                if throttle:
+                    throttle(count)
+        finally:
+            writer.flush(sink)
+        return sink.bytes_written
+    buffer = chunk_buffer(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        count = raw.readinto(view)
+        if not count:
+            break
+        sink.write(view[:count])
+        if progress:
+            progress(count)
+        if throttle:
+            throttle(count)
+    return sink.bytes_written
@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import MEDIA_EXT
+from .extract import JsonExtractor, dvach_json_url, get_extractor
+from .ratelimit import describe_status
+
+STATE_FILE = ".watch.json"
+MIN_INTERVAL = 30
+MAX_INTERVAL = 30 * 60
+BACKOFF = 1.5
+
+
+class WatchedThread:
+    def __init__(self, url, output_path, host_type):
+        self.url = url
+        self.output_path = output_path
+        self.host_type = host_type
+        self.json_url = dvach_json_url(url) if host_type == "2ch" else None
+        self.etag = None
+        self.last_modified = None
+        self.last_post = 0
+        self.known = set()
+        self.pending = set()
+        self.failed = set()
+        self.interval = MIN_INTERVAL
+        self.finished = False
+        self.lock = threading.Lock()
+
+    @property
+    def state_file(self):
+        return os.path.join(self.output_path, STATE_FILE)
+
+    def load(self):
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.etag = state.get("etag")
+        self.last_modified = state.get("last_modified")
+        self.last_post = state.get("last_post", 0)
+        self.known = set(state.get("known", []))
+        # files that failed or were still downloading: their posts are already
+        # behind last_post and the ETag, so only this list brings them back
+        self.failed = set(state.get("retry", []))
+        self.interval = state.get("interval", MIN_INTERVAL)
+
+    def save(self):
+        os.makedirs(self.output_path, exist_ok=True)
+        with self.lock:
+            state = {
+                "url": self.url,
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "last_post": self.last_post,
+                "known": sorted(self.known),
+                "retry": sorted(self.failed | self.pending),
+                "interval": self.interval,
+            }
+        temp = self.state_file + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(state, f)
+        os.replace(temp, self.state_file)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ThreadWatcher:
+    """Polls live threads and downloads only attachments that appeared since the last poll.
+
+    Every thread is polled with If-None-Match/If-Modified-Since, so an
+    unchanged thread costs one 304. 2ch threads are read through the
+    `res/<id>.json` API and only posts newer than the last seen post number
+    are looked at. The poll interval halves when a thread gets new media and
+    grows by `BACKOFF` when it does not, between `min_interval` and
+    `max_interval`. All threads share one scheduler thread, one pool for
+    polls and one pool for file downloads.
+    """
+
+    def __init__(self, downloader, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, poll_workers=4):
+        self.downloader = downloader
+        self.logger = downloader.logger
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_workers = poll_workers
+        self.session = requests.Session()
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._active = 0
+
+    def add(self, url, output_path, host_type):
+        thread = WatchedThread(url, output_path, host_type)
+        thread.load()
+        thread.interval = min(max(thread.interval, self.min_interval), self.max_interval)
+        self._schedule(thread, 0)
+        return thread
+
+    def _schedule(self, thread, delay):
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), thread))
+            self._condition.notify()
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        with ThreadPoolExecutor(max_workers=self.downloader.max_workers) as downloads, \
+                ThreadPoolExecutor(max_workers=self.poll_workers) as polls:
+            while not stop_event.is_set():
+                with self._condition:
+                    if not self._queue and not self._active:
+                        break
+                    if not self._queue:
+                        self._condition.wait(1.0)
+                        continue
+                    due, _, thread = self._queue[0]
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        self._condition.wait(min(wait, 1.0))
+                        continue
+                    heapq.heappop(self._queue)
+                    self._active += 1
+                polls.submit(self._poll, thread, downloads)
+        self.session.close()
+
+    def _poll(self, thread, downloads):
+        try:
+            new_links = self._fetch_new_links(thread)
+            if new_links:
+                thread.interval = max(self.min_interval, thread.interval / 2)
+                self.logger.info(f"Found {len(new_links)} new files in {thread.url}")
+            else:
+                thread.interval = min(self.max_interval, thread.interval * BACKOFF)
+            with thread.lock:
+                links = (new_links or []) + [link for link in thread.failed if link not in thread.pending]
+                thread.failed.clear()
+            self._download(thread, links, downloads)
+            if new_links is not None and not links:
+                thread.save()
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"An error occurred while polling {thread.url}: {str(e)}")
+            thread.interval = min(self.max_interval, thread.interval * BACKOFF)
+        except Exception as e:
+            self.logger.error(f"An unexpected error occurred while polling {thread.url}: {str(e)}")
+        finally:
+            with self._condition:
+                self._active -= 1
+                if not thread.finished:
+                    heapq.heappush(self._queue, (time.monotonic() + thread.interval, next(self._counter), thread))
+                self._condition.notify()
+
+    def _fetch_new_links(self, thread):
+        url = thread.json_url or thread.url
+        lease = self.downloader.host_limits.for_url(url).lease()
+        try:
+            response = self.session.get(url, headers=thread.conditional_headers(),
+                                        timeout=self.downloader.request_timeout)
+        except requests.exceptions.RequestException:
+            lease.release(overloaded=True)
+            raise
+        lease.responded()
+        if response.status_code >= 400:
+            _, overloaded, retry_after = describe_status(response.status_code, response.headers)
+            lease.release(overloaded, retry_after)
+        else:
+            lease.release()
+        if response.status_code == 304:
+            self.logger.debug(f"No changes in {thread.url}")
+            return None
+        if response.status_code == 404:
+            self.logger.info(f"Thread {thread.url} is gone. Stopping watching it.")
+            thread.finished = True
+            return None
+        response.raise_for_status()
+        thread.etag = response.headers.get("ETag")
+        thread.last_modified = response.headers.get("Last-Modified")
+        if thread.json_url:
+            extractor = JsonExtractor(MEDIA_EXT, after_post=thread.last_post)
+            links = extractor.extract(response.content)
+            thread.last_post = extractor.last_post
+        else:
+            links = get_extractor(self.downloader.extractor, MEDIA_EXT).extract(response.content)
+        with thread.lock:
+            return [link for link in dict.fromkeys(links) if link not in thread.known and link not in thread.pending]
+
+    def _download(self, thread, links, downloads):
+        if not links:
+            return
+        os.makedirs(thread.output_path, exist_ok=True)
+        for link in links:
+            with thread.lock:
+                thread.pending.add(link)
+            future = downloads.submit(self.downloader.download_file, link, thread.output_path, thread.host_type,
+                                      thread.url)
+            future.add_done_callback(lambda f, link=link: self._downloaded(thread, link, f))
+
+    def _downloaded(self, thread, link, future):
+        with thread.lock:
+            thread.pending.discard(link)
+            if not future.cancelled() and future.result():
+                thread.known.add(link)
+            else:
+                thread.failed.add(link)
+            done = not thread.pending
+        if done:
+            thread.save()
+
+
+def watch_threads(downloader, stop_event=None, **kwargs):
+    watcher = ThreadWatcher(downloader, **kwargs)
+    for url, output_path, host_type in downloader._thread_jobs():
+        watcher.add(url, output_path, host_type)
+    watcher.run(stop_event)
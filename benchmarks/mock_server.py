@@ -0,0 +1,333 @@
+"""Local stand-in for 2ch and arhivach used by the benchmarks.
+
+Thread pages and media are synthesized from a seed, so every run sees the
+same threads, the same file sizes and the same injected errors. The board
+lives under `/2ch/` and `/arhivach/` of one server; point
+`apiDownloader.DVACH`/`ARCHIVACH` at `base_url` (2ch paths already carry
+the `/2ch` prefix) to make the downloader use it. For crawl mode the
+board also serves `/2ch/catalog.json` and `/arhivach/index/<offset>/`.
+"""
+import calendar
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+KB = 1024
+MB = 1024 * KB
+BLOCK = random.Random(0).randbytes(MB)
+WRITE_CHUNK = 64 * KB
+ERROR_KINDS = ("500", "503", "429", "reset")
+FIRST_DATE = datetime.date(2024, 1, 1)
+INDEX_PAGE_SIZE = 25
+
+
+def _fixed(size):
+    return lambda rng, ext: size
+
+
+def _mixed(rng, ext):
+    # roughly what a busy 2ch thread looks like: mostly pictures, a few webms
+    if ext in ("webm", "mp4"):
+        return int(rng.lognormvariate(14.5, 0.8))
+    return int(rng.lognormvariate(12.0, 0.9))
+
+
+SIZE_DISTRIBUTIONS = {
+    "small": lambda rng, ext: rng.randint(20 * KB, 200 * KB),
+    "mixed": _mixed,
+    "large": lambda rng, ext: rng.randint(2 * MB, 16 * MB),
+}
+
+
+def size_distribution(spec):
+    """`small`, `mixed`, `large` or `fixed:<bytes>`."""
+    if spec.startswith("fixed:"):
+        return _fixed(int(spec.split(":", 1)[1]))
+    if spec not in SIZE_DISTRIBUTIONS:
+        raise ValueError(f"Unknown size distribution: {spec}")
+    return SIZE_DISTRIBUTIONS[spec]
+
+
+def payload(size, offset=0):
+    """Yield `size` deterministic bytes starting at `offset`, in chunks."""
+    position = offset
+    end = offset + size
+    while position < end:
+        start = position % len(BLOCK)
+        chunk = BLOCK[start:start + min(WRITE_CHUNK, end - position)]
+        position += len(chunk)
+        yield chunk
+
+
+class MockThread:
+    def __init__(self, host_type, thread_id, files, date=None):
+        self.host_type = host_type
+        self.thread_id = thread_id
+        # [(name, size)]
+        self.files = files
+        self.date = date or FIRST_DATE
+
+    def media_path(self, name):
+        if self.host_type == "2ch":
+            return f"/2ch/src/{self.thread_id}/{name}"
+        return f"/arhivach/storage/{self.thread_id}/{name}"
+
+    def page_path(self):
+        if self.host_type == "2ch":
+            return f"/2ch/res/{self.thread_id}.html"
+        return f"/arhivach/thread/{self.thread_id}/"
+
+
+class MockBoard:
+    """Synthetic threads plus an HTTP server that serves them.
+
+    `latency` delays every response (seconds before the first byte),
+    `bandwidth` caps each connection in bytes/s and `error_rate` is the share
+    of media URLs whose first request fails with a 500, 503, 429 or a reset
+    connection; the retry of such a URL succeeds.
+    """
+
+    def __init__(self, threads=4, files_per_thread=50, sizes="mixed", latency=0.0, bandwidth=None,
+                 error_rate=0.0, hosts=("2ch", "arhivach"), seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.seed = seed
+        self.threads = {}
+        self.media = {}
+        self.requests = 0
+        self.errors = 0
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._server = None
+        rng = random.Random(seed)
+        sizes = size_distribution(sizes)
+        for index in range(threads):
+            host_type = hosts[index % len(hosts)]
+            thread_id = 1000 + index
+            files = []
+            for number in range(files_per_thread):
+                ext = rng.choice(("jpg", "jpg", "png", "gif", "webm", "mp4"))
+                files.append((f"{thread_id}{number:05d}.{ext}", max(1, sizes(rng, ext))))
+            thread = MockThread(host_type, thread_id, files, FIRST_DATE + datetime.timedelta(days=index))
+            self.threads[thread.page_path()] = thread
+            if host_type == "2ch":
+                self.threads[f"/2ch/res/{thread_id}.json"] = thread
+            for name, size in files:
+                self.media[thread.media_path(name)] = size
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def thread_urls(self):
+        return [self.base_url + thread.page_path() for path, thread in self.threads.items()
+                if not path.endswith(".json")]
+
+    def total_bytes(self):
+        return sum(self.media.values())
+
+    def start(self, host="127.0.0.1", port=0):
+        board = self
+
+        class Handler(MockHandler):
+            pass
+
+        Handler.board = board
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def listing(self, path):
+        """Board listings for crawl mode: the 2ch catalog and arhivach index pages."""
+        if path == "/2ch/catalog.json":
+            return "application/json", render_2ch_catalog(self._threads_of("2ch"))
+        if path.startswith("/arhivach/index/"):
+            offset = int(path.strip("/").rsplit("/", 1)[1])
+            threads = sorted(self._threads_of("arhivach"), key=lambda thread: thread.date, reverse=True)
+            return "text/html; charset=utf-8", render_arhivach_index(threads[offset:offset + INDEX_PAGE_SIZE])
+        return None
+
+    def _threads_of(self, host_type):
+        return [thread for path, thread in self.threads.items()
+                if thread.host_type == host_type and not path.endswith(".json")]
+
+    def injected_error(self, path):
+        """The error kind for the first request of an unlucky path, else None."""
+        if not self.error_rate:
+            return None
+        digest = hashlib.sha1(f"{self.seed}:{path}".encode()).digest()
+        if int.from_bytes(digest[:4], "big") / 2 ** 32 >= self.error_rate:
+            return None
+        with self._lock:
+            if path in self._failed:
+                return None
+            self._failed.add(path)
+            self.errors += 1
+        return ERROR_KINDS[digest[4] % len(ERROR_KINDS)]
+
+    def render(self, path):
+        thread = self.threads[path]
+        if path.endswith(".json"):
+            return "application/json", render_2ch_json(thread)
+        if thread.host_type == "2ch":
+            return "text/html; charset=utf-8", render_2ch_html(thread)
+        return "text/html; charset=utf-8", render_arhivach_html(thread, self.base_url)
+
+
+def render_2ch_html(thread):
+    posts = []
+    for number, (name, size) in enumerate(thread.files):
+        path = thread.media_path(name)
+        posts.append(
+            f'<div class="post" id="post-{number}"><div class="post__details">'
+            f'<span class="post__anon">Аноним</span> <a class="post__reflink" href="#{number}">№{number}</a></div>'
+            f'<div class="post__images"><figure class="post__image"><a href="{path}" class="post__image-link" '
+            f'target="_blank"><img src="{path}s.jpg" width="200" height="150"></a>'
+            f'<figcaption>{size // KB}Кб</figcaption></figure></div>'
+            f'<article class="post__message">Текст сообщения &gt;&gt;{number}<br>'
+            f'<a href="https://example.com/page">link</a></article></div>')
+    return ("<html><head><title>thread</title></head><body>" + "".join(posts) + "</body></html>").encode()
+
+
+def render_2ch_json(thread):
+    posts = [{"num": number + 1, "files": [{"path": thread.media_path(name), "size": max(1, size // KB)}]}
+             for number, (name, size) in enumerate(thread.files)]
+    return json.dumps({"threads": [{"posts": posts}]}).encode()
+
+
+def render_2ch_catalog(threads):
+    return json.dumps({"board": "2ch", "threads": [
+        {"num": thread.thread_id, "subject": f"Тред {thread.thread_id}",
+         "timestamp": calendar.timegm(thread.date.timetuple()) + 12 * 3600}
+        for thread in threads]}).encode()
+
+
+def render_arhivach_index(threads):
+    rows = "".join(f'<tr><td><a href="{thread.page_path()}">Тред {thread.thread_id}</a> /2ch/</td>'
+                   f'<td>{thread.date:%d.%m.%Y} 12:00</td></tr>' for thread in threads)
+    return f"<html><body><table>{rows}</table></body></html>".encode()
+
+
+def render_arhivach_html(thread, base_url):
+    posts = []
+    for number, (name, size) in enumerate(thread.files):
+        path = thread.media_path(name)
+        # arhivach links pictures relative to the site and videos with a full URL
+        href = path if not name.endswith(("webm", "mp4")) else base_url + path
+        posts.append(f'<div class="post"><a class="expand_image" href="{href}">'
+                     f'<img src="{path}.thumb.jpg"></a><div class="post_comment">пост {number}</div></div>')
+    return ("<html><body>" + "".join(posts) + "</body></html>").encode()
+
+
+def media_etag(path, size):
+    return f'"{hashlib.sha1(path.encode()).hexdigest()[:16]}-{size}"'
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    board = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        board = self.board
+        with board._lock:
+            board.requests += 1
+        if board.latency:
+            time.sleep(board.latency)
+        path = self.path.split("?", 1)[0]
+        if path in board.threads:
+            content_type, body = board.render(path)
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send_headers(304, {"ETag": etag})
+                return
+            self._send_headers(200, {"Content-Type": content_type, "Content-Length": str(len(body)), "ETag": etag})
+            self._send_body([body])
+        elif path in board.media:
+            self._send_media(path, board.media[path])
+        else:
+            listing = board.listing(path)
+            if listing is None:
+                self.send_error(404)
+                return
+            content_type, body = listing
+            self._send_headers(200, {"Content-Type": content_type, "Content-Length": str(len(body))})
+            self._send_body([body])
+
+    def do_HEAD(self):
+        path = self.path.split("?", 1)[0]
+        size = self.board.media.get(path)
+        if size is None:
+            self._send_headers(404, {"Content-Length": "0"})
+            return
+        self._send_headers(200, {"Content-Length": str(size), "ETag": media_etag(path, size)})
+
+    def _send_media(self, path, size):
+        error = self.board.injected_error(path)
+        if error in ("500", "503", "429"):
+            headers = {"Content-Length": "0"}
+            if error == "429":
+                headers["Retry-After"] = "0"
+            self._send_headers(int(error), headers)
+            return
+        etag = media_etag(path, size)
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) == etag:
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            if start >= size:
+                self._send_headers(416, {"Content-Range": f"bytes */{size}", "Content-Length": "0"})
+                return
+            self._send_headers(206, {"Content-Range": f"bytes {start}-{size - 1}/{size}",
+                                     "Content-Length": str(size - start), "ETag": etag})
+        else:
+            self._send_headers(200, {"Content-Length": str(size), "ETag": etag})
+        length = size - start
+        if error == "reset":
+            # drop the connection halfway through the body
+            length //= 2
+            self.close_connection = True
+        self._send_body(payload(length, start))
+
+    def _send_headers(self, status, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send_body(self, chunks):
+        bandwidth = self.board.bandwidth
+        started = time.monotonic()
+        sent = 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
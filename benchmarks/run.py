@@ -0,0 +1,230 @@
+"""Throughput benchmarks for the download and parse hot paths.
+
+    python -m benchmarks.run --engines thread,async --concurrency 4,16,64
+    python -m benchmarks.run --parse
+
+Each engine/concurrency case downloads the whole mock board into a fresh
+temporary folder in its own process, so peak RSS and CPU time belong to
+that case alone. `--json` writes the results for comparison between runs.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .mock_server import MockBoard, MockThread, render_2ch_html, size_distribution
+
+ENGINES = ("thread", "async")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class LatencyRecorder:
+    """Event subscriber that times every file from FILE_STARTED to its end."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = {}
+        self.latencies = []
+        self.bytes = 0
+        self.files = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def __call__(self, event):
+        from apiDownloader import events
+
+        now = time.perf_counter()
+        with self.lock:
+            if event.kind == events.FILE_STARTED:
+                self.started[event.file_url] = now
+            elif event.kind == events.FILE_DONE:
+                self.files += 1
+                self.bytes += event.bytes or 0
+                started = self.started.pop(event.file_url, None)
+                if started is not None:
+                    self.latencies.append(now - started)
+            elif event.kind == events.FILE_SKIPPED:
+                self.skipped += 1
+            elif event.kind == events.ERROR and event.file_url:
+                self.errors += 1
+                self.started.pop(event.file_url, None)
+
+
+def run_case(case):
+    """Download every thread of `case["base_url"]` once; runs inside the case process."""
+    import apiDownloader
+
+    apiDownloader.DVACH = case["base_url"]
+    apiDownloader.ARCHIVACH = case["base_url"]
+    recorder = LatencyRecorder()
+    output_path = tempfile.mkdtemp(prefix="bench-")
+    kwargs = dict(max_workers=case["concurrency"], max_per_host=case["concurrency"], listeners=[recorder],
+                  extractor=case["extractor"], writers=case["writers"], fsync=case["fsync"])
+    if case["engine"] == "async":
+        downloader = apiDownloader.AsyncDownloader(case["urls"], os.path.join(output_path, ""), **kwargs)
+    else:
+        downloader = apiDownloader.Downloader(case["urls"], os.path.join(output_path, ""), **kwargs)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    try:
+        downloader.start_download()
+    finally:
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        shutil.rmtree(output_path, ignore_errors=True)
+    return {
+        "engine": case["engine"],
+        "concurrency": case["concurrency"],
+        "files": recorder.files,
+        "errors": recorder.errors,
+        "seconds": elapsed,
+        "files_per_sec": recorder.files / elapsed,
+        "mb_per_sec": recorder.bytes / elapsed / 2 ** 20,
+        "p50_ms": (percentile(recorder.latencies, 0.5) or 0) * 1000,
+        "p99_ms": (percentile(recorder.latencies, 0.99) or 0) * 1000,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": peak_rss_mb(),
+        # seconds per pipeline stage, summed over all pages and files
+        "stages": {sample["labels"]["stage"]: sample["sum"]
+                   for sample in downloader.metrics.snapshot()["stage_seconds"]["samples"]},
+    }
+
+
+def spawn_case(case):
+    result = subprocess.run([sys.executable, "-m", "benchmarks.run", "--case", json.dumps(case)],
+                            stdout=subprocess.PIPE, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+
+def run_downloads(args):
+    board = MockBoard(threads=args.threads, files_per_thread=args.files, sizes=args.sizes,
+                      latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+                      seed=args.seed)
+    results = []
+    with board:
+        print(f"mock board: {len(board.media)} files, {board.total_bytes() / 2 ** 20:.1f} MB, "
+              f"{args.threads} threads at {board.base_url}")
+        print_header()
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                board.requests = 0
+                board._failed.clear()
+                case = {"engine": engine, "concurrency": concurrency, "base_url": board.base_url,
+                        "urls": board.thread_urls(), "extractor": args.extractor, "writers": args.writers,
+                        "fsync": args.fsync}
+                result = spawn_case(case)
+                result["requests"] = board.requests
+                results.append(result)
+                print_row(result)
+    return results
+
+
+def print_header():
+    print(f"{'engine':<8}{'conc':>5}{'files':>7}{'err':>5}{'files/s':>10}{'MB/s':>9}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'cpu s':>8}{'rss MB':>8}")
+
+
+def print_row(result):
+    rss = result["peak_rss_mb"]
+    print(f"{result['engine']:<8}{result['concurrency']:>5}{result['files']:>7}{result['errors']:>5}"
+          f"{result['files_per_sec']:>10.1f}{result['mb_per_sec']:>9.1f}{result['p50_ms']:>9.1f}"
+          f"{result['p99_ms']:>9.1f}{result['cpu_seconds']:>8.2f}{rss if rss is None else round(rss, 1):>8}")
+
+
+def run_parse(args):
+    """Time every extractor on one synthetic 2ch page, best of `args.repeat`."""
+    import random
+    from apiDownloader import MEDIA_EXT
+    from apiDownloader.extract import EXTRACTORS, etree, get_extractor
+
+    rng = random.Random(args.seed)
+    sizes = size_distribution(args.sizes)
+    files = []
+    for number in range(args.posts):
+        ext = rng.choice(("jpg", "png", "webm", "mp4"))
+        files.append((f"{number}.{ext}", sizes(rng, ext)))
+    thread = MockThread("2ch", 1, files)
+    page = render_2ch_html(thread)
+    names = [name for name in EXTRACTORS if name != "json" and (name != "lxml" or etree is not None)]
+    results = []
+    print(f"page: {len(page) / 2 ** 20:.2f} MB, {args.posts} posts")
+    for name in names:
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            links = get_extractor(name, MEDIA_EXT).extract(page)
+            best = min(best, time.perf_counter() - started)
+        results.append({"extractor": name, "links": len(links), "ms": best * 1000})
+        print(f"{name:<10}{len(links):>7} links{best * 1000:>10.1f} ms")
+    return results
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--engines", type=lambda value: value.split(","), default=list(ENGINES))
+    parser.add_argument("--concurrency", type=int_list, default=[4, 16, 64])
+    parser.add_argument("--threads", type=int, default=4, help="threads on the mock board")
+    parser.add_argument("--files", type=int, default=50, help="files per thread")
+    parser.add_argument("--sizes", default="mixed", help="small, mixed, large or fixed:<bytes>")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before the first byte")
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes/s per connection")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of media URLs failing once")
+    parser.add_argument("--extractor", default="auto")
+    parser.add_argument("--writers", type=int, default=2, help="disk writer threads, 0 writes on the network workers")
+    parser.add_argument("--fsync", default="never", help="never, batch or always")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parse", action="store_true", help="benchmark the page extractors instead")
+    parser.add_argument("--posts", type=int, default=1500, help="posts on the --parse page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+    unknown = set(args.engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+
+    if args.parse:
+        results = run_parse(args)
+    else:
+        results = run_downloads(args)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Cold-start time of the GUI.
+
+    python -m benchmarks.startup --runs 10 --max-ms 800
+
+Each run starts `ui.py --measure-startup` in a fresh interpreter, which
+prints how long it took from the first line of `ui.py` to the first event
+loop iteration with the window shown, and exits. The wall time also covers
+interpreter startup. Without a display the runs use the `offscreen` Qt
+platform. `--max-ms` fails the run when the median exceeds it, so a
+regression can break CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .run import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_once(script):
+    env = dict(os.environ)
+    if not env.get("DISPLAY") and sys.platform.startswith("linux"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, script, "--measure-startup"], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, check=True, cwd=ROOT, env=env)
+    wall = (time.perf_counter() - started) * 1000
+    for line in result.stdout.decode().splitlines():
+        if line.startswith("startup_ms "):
+            return wall, float(line.split()[1])
+    raise RuntimeError(f"{script} did not report its startup time")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--script", default=os.path.join(ROOT, "ui.py"))
+    parser.add_argument("--max-ms", type=float, help="fail if the median in-process startup exceeds this")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    walls, startups = [], []
+    for _ in range(args.runs):
+        wall, startup = measure_once(args.script)
+        walls.append(wall)
+        startups.append(startup)
+    result = {
+        "runs": args.runs,
+        "startup_ms_p50": percentile(startups, 0.5),
+        "startup_ms_max": max(startups),
+        "wall_ms_p50": percentile(walls, 0.5),
+        "wall_ms_max": max(walls),
+    }
+    print(f"startup {result['startup_ms_p50']:.0f} ms (max {result['startup_ms_max']:.0f}), "
+          f"process wall {result['wall_ms_p50']:.0f} ms (max {result['wall_ms_max']:.0f}) over {args.runs} runs")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.max_ms is not None and result["startup_ms_p50"] > args.max_ms:
+        print(f"startup regression: median {result['startup_ms_p50']:.0f} ms > {args.max_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from apiDownloader import BandwidthScheduler, Downloader, PageCache, PostProcessor, events
+
+MAX_UPDATES_PER_SECOND = 10
+PAGE_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'python-2ch-app', 'pages.sqlite')
+
+
+class ProgressTracker:
+    # Подписчик на события apiDownloader: собирает их из рабочих потоков и
+    # отдаёт в emit не больше max_updates_per_second снимков в секунду;
+    # промежуточные события просто накапливаются в счётчиках
+    def __init__(self, emit, max_updates_per_second=MAX_UPDATES_PER_SECOND):
+        self.emit = emit
+        self.interval = 1.0 / max_updates_per_second
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.last_bytes = 0
+        self.bytes_per_sec = 0.0
+        self.bytes = 0
+        self.files_done = 0
+        self.files_total = 0
+        self.errors = 0
+        self.threads = {}
+        self.message = ''
+
+    def __call__(self, event):
+        force = False
+        with self.lock:
+            if event.kind == events.THREAD_STARTED:
+                self.threads[event.thread_url] = [0, event.total]
+                self.files_total += event.total
+                force = True
+            elif event.kind == events.FILE_PROGRESS:
+                self.bytes += event.bytes
+            elif event.kind in (events.FILE_DONE, events.FILE_SKIPPED):
+                self.files_done += 1
+                if event.thread_url in self.threads:
+                    self.threads[event.thread_url][0] += 1
+                self.message = f'Загружен {event.filename}'
+            elif event.kind == events.ERROR:
+                if event.file_url:
+                    # файл с ошибкой тоже считается обработанным, иначе прогресс не дойдёт до 100%
+                    self.files_done += 1
+                    if event.thread_url in self.threads:
+                        self.threads[event.thread_url][0] += 1
+                # ошибки только считаются: тред с сотнями битых ссылок не должен
+                # обходить ограничение частоты обновлений
+                self.errors += 1
+                self.message = f'Ошибка: {event.error}'
+            elif event.kind == events.THREAD_DONE:
+                force = True
+        self.maybe_emit(force)
+
+    def snapshot(self):
+        return {
+            'bytes': self.bytes,
+            'bytes_per_sec': self.bytes_per_sec,
+            'files_done': self.files_done,
+            'files_total': self.files_total,
+            'errors': self.errors,
+            'threads': {url: tuple(progress) for url, progress in self.threads.items()},
+            'message': self.message,
+            'elapsed': time.monotonic() - self.started,
+        }
+
+    def maybe_emit(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_emit
+            if not force and elapsed < self.interval:
+                return
+            if self.last_emit:
+                self.bytes_per_sec = (self.bytes - self.last_bytes) / max(elapsed, 1e-6)
+            self.last_emit = now
+            self.last_bytes = self.bytes
+            snapshot = self.snapshot()
+        self.emit(snapshot)
+
+
+class DownloadWorker(QObject):
+    # Живёт в отдельном QThread; в GUI уходят только сигналы
+    progress = pyqtSignal(dict)
+    finished = pyqtSignal()
+
+    def __init__(self, urls, output_path, max_workers=5, log_file=None,
+                 max_updates_per_second=MAX_UPDATES_PER_SECOND, bandwidth=None, postprocess=False):
+        super().__init__()
+        self.urls = urls
+        self.output_path = output_path
+        self.max_workers = max_workers
+        self.log_file = log_file
+        # раздел bandwidth из settings.json: общий лимит, лимит на тред и расписание
+        self.bandwidth = bandwidth
+        # миниатюры, размеры и индекс треда для просмотра медиа строятся во время загрузки
+        self.postprocess = postprocess
+        self.max_updates_per_second = max_updates_per_second
+        self.stopped = False
+        self.downloader = None
+
+    def stop(self):
+        # Вызывается из потока GUI: run() занят загрузкой и сигналы не обрабатывает
+        self.stopped = True
+        if self.downloader is not None:
+            self.downloader.stop()
+
+    def run(self):
+        tracker = ProgressTracker(self.progress.emit, self.max_updates_per_second)
+        # кэш страниц общий для всех запусков: повторная загрузка тех же тредов
+        # обходится условными запросами, а архивы arhivach не запрашиваются вовсе
+        page_cache = PageCache(PAGE_CACHE_PATH)
+        try:
+            bandwidth = BandwidthScheduler.from_settings(self.bandwidth) if self.bandwidth else None
+            postprocess = PostProcessor() if self.postprocess else None
+            downloader = Downloader(self.urls, self.output_path, max_workers=self.max_workers,
+                                    log_file=self.log_file, listeners=[tracker], page_cache=page_cache,
+                                    bandwidth=bandwidth, postprocess=postprocess)
+            self.downloader = downloader
+            if self.stopped:
+                downloader.stop()
+            try:
+                downloader.start_download()
+            finally:
+                if postprocess is not None:
+                    postprocess.close()
+        finally:
+            page_cache.close()
+            tracker.maybe_emit(force=True)
+            self.finished.emit()
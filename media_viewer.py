@@ -0,0 +1,352 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import webbrowser
+
+from PyQt5.QtCore import (Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QSize, QThread,
+                          QThreadPool, pyqtSignal)
+from PyQt5.QtGui import QImage, QImageReader, QPixmap
+from PyQt5.QtWidgets import QHeaderView, QLabel, QTableView, QVBoxLayout, QWidget
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+VIDEO_EXTENSIONS = ('.mp4', '.webm')
+SCAN_BATCH_SIZE = 500
+THUMBNAIL_SIZE = 96
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'python-2ch-app', 'thumbnails')
+THUMBNAIL_CACHE_LIMIT = 256 * 1024 * 1024
+# Индекс, который пишет apiDownloader.postprocess.MediaIndex в папке треда
+MEDIA_INDEX_FILE = '.media.sqlite'
+
+
+class ThumbnailCache:
+    # Миниатюры на диске: имя файла — хеш от пути и mtime оригинала, поэтому
+    # изменённый файл автоматически получает новую миниатюру. mtime самой
+    # миниатюры обновляется при каждом попадании и служит меткой для LRU
+    def __init__(self, directory=THUMBNAIL_CACHE_DIR, limit=THUMBNAIL_CACHE_LIMIT):
+        self.directory = directory
+        self.limit = limit
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # размер кеша считается при первой записи в пуле миниатюр, а не при
+        # открытии окна: обход сотен мегабайт миниатюр подвешивал GUI
+        self.size = None
+
+    def key_path(self, path, mtime):
+        key = hashlib.sha1(f'{path}|{mtime}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.png')
+
+    def get(self, path, mtime):
+        cached = self.key_path(path, mtime)
+        image = QImage(cached)
+        if image.isNull():
+            return None
+        try:
+            os.utime(cached)
+        except OSError:
+            pass
+        return image
+
+    def put(self, path, mtime, image):
+        cached = self.key_path(path, mtime)
+        if image.save(cached, 'PNG'):
+            with self.lock:
+                if self.size is None:
+                    self.size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+                else:
+                    self.size += os.path.getsize(cached)
+                if self.size > self.limit:
+                    self.evict()
+
+    def evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()),
+                         key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        # освобождаем с запасом, чтобы не чистить кеш на каждой новой миниатюре
+        target = self.limit * 0.9
+        for entry in entries:
+            if self.size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.size -= size
+            except OSError:
+                pass
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    if path.lower().endswith(VIDEO_EXTENSIONS):
+        return video_frame(path, size)
+    reader = QImageReader(path)
+    original = reader.size()
+    if original.isValid():
+        reader.setScaledSize(original.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    return None if image.isNull() else image
+
+
+def video_frame(path, size=THUMBNAIL_SIZE):
+    # Кадр из видео берём через ffmpeg, если он есть в PATH
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return None
+    handle, frame_path = tempfile.mkstemp(suffix='.png')
+    os.close(handle)
+    try:
+        subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-ss', '1', '-i', path, '-frames:v', '1',
+                        '-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease', frame_path],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        image = QImage(frame_path)
+        return None if image.isNull() else image
+    except (OSError, subprocess.SubprocessError):
+        return None
+    finally:
+        os.remove(frame_path)
+
+
+class ThumbnailSignals(QObject):
+    ready = pyqtSignal(str, QImage)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, path, mtime, cache, signals, thumbnail=None):
+        super().__init__()
+        self.path = path
+        self.mtime = mtime
+        self.cache = cache
+        self.signals = signals
+        self.thumbnail = thumbnail
+
+    def run(self):
+        # Готовая миниатюра из индекса треда, иначе свой кеш
+        image = QImage(self.thumbnail) if self.thumbnail else None
+        if image is None or image.isNull():
+            image = self.cache.get(self.path, self.mtime)
+        if image is None:
+            image = make_thumbnail(self.path)
+            if image is None:
+                image = QImage()
+            else:
+                self.cache.put(self.path, self.mtime, image)
+        self.signals.ready.emit(self.path, image)
+
+
+def format_info(kind, width, height, duration):
+    parts = []
+    if width and height:
+        parts.append(f'{width}×{height}')
+    if duration:
+        parts.append(f'{int(duration) // 60}:{int(duration) % 60:02d}')
+    return ' '.join(parts)
+
+
+def index_details(directory):
+    # Сведения из индекса постобработки по полному пути файла:
+    # (размер, mtime, описание, миниатюра, почти одинаковая картинка)
+    uri = 'file:' + os.path.join(directory, MEDIA_INDEX_FILE) + '?mode=ro'
+    connection = sqlite3.connect(uri, uri=True)
+    try:
+        rows = connection.execute('SELECT name, size, mtime, kind, width, height, duration, thumbnail, '
+                                  'duplicate_of FROM media').fetchall()
+    finally:
+        connection.close()
+    details = {}
+    for name, size, mtime, kind, width, height, duration, thumbnail, duplicate_of in rows:
+        path = os.path.join(directory, *name.split('/'))
+        thumbnail = os.path.join(directory, *thumbnail.split('/')) if thumbnail else None
+        details[path] = (size, mtime, format_info(kind, width, height, duration), thumbnail, duplicate_of is not None)
+    return details
+
+
+class DirectoryScanner(QObject):
+    # Обходит папку через os.scandir в отдельном потоке и отдаёт файлы пачками.
+    # Папка треда с индексом постобработки показывается сразу из индекса
+    # (почти одинаковые картинки скрыты), а обход её подпапок без stat только
+    # добавляет файлы, которых в индексе нет
+    batch = pyqtSignal(list)
+    finished = pyqtSignal()
+
+    def __init__(self, directory, batch_size=SCAN_BATCH_SIZE):
+        super().__init__()
+        self.directory = directory
+        self.batch_size = batch_size
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def emit_index(self, details):
+        rows = sorted((os.path.basename(path), path, size, mtime, info, thumbnail)
+                      for path, (size, mtime, info, thumbnail, duplicate) in details.items() if not duplicate)
+        for start in range(0, len(rows), self.batch_size):
+            if self.stopped:
+                return
+            self.batch.emit(rows[start:start + self.batch_size])
+
+    def run(self):
+        pending = [self.directory]
+        entries = []
+        indexed = set()
+        while pending and not self.stopped:
+            directory = pending.pop()
+            if os.path.exists(os.path.join(directory, MEDIA_INDEX_FILE)):
+                try:
+                    details = index_details(directory)
+                except sqlite3.Error:
+                    details = {}
+                self.emit_index(details)
+                indexed.update(details)
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        # флаг проверяется на каждом файле: иначе закрытие окна
+                        # ждало бы обхода всей огромной папки треда
+                        if self.stopped:
+                            break
+                        if entry.is_dir(follow_symlinks=False):
+                            if not entry.name.startswith('.'):
+                                pending.append(entry.path)
+                        elif (entry.path not in indexed and entry.is_file() and not entry.name.startswith('.')
+                              and not entry.name.endswith(('.part', '.json', '.jsonl', '.sqlite'))):
+                            stat = entry.stat()
+                            entries.append((entry.name, entry.path, stat.st_size, stat.st_mtime, '', None))
+                            if len(entries) >= self.batch_size:
+                                self.batch.emit(entries)
+                                entries = []
+            except OSError:
+                continue
+        if entries:
+            self.batch.emit(entries)
+        self.finished.emit()
+
+
+class MediaTableModel(QAbstractTableModel):
+    HEADERS = ['File Name', 'Size', 'Info']
+
+    def __init__(self, cache, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.row_by_path = {}
+        self.thumbnails = {}
+        self.requested = set()
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(THUMBNAIL_WORKERS)
+        self.signals = ThumbnailSignals()
+        self.signals.ready.connect(self.thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        name, path, size, mtime, info, thumbnail = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return (name, f'{size / 1024:.0f} KB', info)[index.column()]
+        if role == Qt.UserRole:
+            return path
+        if role == Qt.DecorationRole and index.column() == 0:
+            # миниатюра запрашивается только для строк, которые реально рисуются
+            if path in self.thumbnails:
+                return self.thumbnails[path]
+            if path not in self.requested:
+                self.requested.add(path)
+                self.pool.start(ThumbnailTask(path, mtime, self.cache, self.signals, thumbnail))
+        return None
+
+    def add_entries(self, entries):
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        for offset, entry in enumerate(entries):
+            self.row_by_path[entry[1]] = first + offset
+        self.rows.extend(entries)
+        self.endInsertRows()
+
+    def thumbnail_ready(self, path, image):
+        row = self.row_by_path.get(path)
+        if row is None:
+            return
+        self.thumbnails[path] = None if image.isNull() else QPixmap.fromImage(image)
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def shutdown(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class MediaViewer(QWidget):
+    def __init__(self, folder_path):
+        # Тёмная тема задаётся один раз на всё приложение (см. ui.main)
+        super().__init__()
+
+        self.setWindowTitle('Media Viewer')
+        self.folder_path = folder_path
+        self.scan_thread = None
+        self.scanner = None
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        self.statusLabel = QLabel('')
+        layout.addWidget(self.statusLabel)
+
+        # Таблица рисует только видимые строки, данные лежат в модели
+        self.model = MediaTableModel(ThumbnailCache(), self)
+        self.media_table = QTableView()
+        self.media_table.setModel(self.model)
+        self.media_table.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.media_table.verticalHeader().setDefaultSectionSize(THUMBNAIL_SIZE + 4)
+        self.media_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.media_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        self.media_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
+        self.media_table.doubleClicked.connect(self.open_media)
+        layout.addWidget(self.media_table)
+
+        self.setLayout(layout)
+        self.load_files()
+
+    def load_files(self):
+        self.load_from_directory(self.folder_path)
+
+    def load_from_directory(self, directory):
+        self.statusLabel.setText('Сканирование...')
+        self.scan_thread = QThread(self)
+        self.scanner = DirectoryScanner(directory)
+        self.scanner.moveToThread(self.scan_thread)
+        self.scan_thread.started.connect(self.scanner.run)
+        self.scanner.batch.connect(self.model.add_entries)
+        self.scanner.finished.connect(self.scan_finished)
+        self.scanner.finished.connect(self.scan_thread.quit)
+        self.scan_thread.start()
+
+    def scan_finished(self):
+        self.statusLabel.setText(f'Файлов: {self.model.rowCount()}')
+
+    def open_media(self, index):
+        file_path = self.model.data(index, Qt.UserRole)
+        webbrowser.open(file_path)
+
+    def closeEvent(self, event):
+        if self.scanner:
+            self.scanner.stop()
+        if self.scan_thread:
+            self.scan_thread.quit()
+            self.scan_thread.wait()
+        self.model.shutdown()
+        super().closeEvent(event)
@@ -10,13 +10,15 @@ urls = [
 # Путь для сохранения файлов
 output_path = "/path/to/save/files/"
 
-# Создаем экземпляр загрузчика
-downloader = dwn(urls, output_path)
-
-# Настраиваем параметры загрузки
-downloader.max_workers = 10  # количество одновременных потоков
-downloader.log_level = logging.DEBUG  # уровень логирования
-downloader.log_file = "/path/to/logfile.log"  # файл журнала
+# Создаем экземпляр загрузчика; параметры передаются в конструктор,
+# иначе логирование уже настроено со значениями по умолчанию
+downloader = dwn(
+    urls,
+    output_path,
+    max_workers=10,  # количество одновременных потоков
+    log_level=logging.DEBUG,  # уровень логирования
+    log_file="/path/to/logfile.log",  # файл журнала
+)
 
 # Запускаем загрузку файлов
 downloader.start_download()
@@ -1,55 +1,22 @@
+import time
+
+# Отсчёт времени запуска начинается до всех тяжёлых импортов
+STARTUP_STARTED = time.perf_counter()
+
 import json
 import os
-import threading
-import webbrowser
+import sys
 import qdarkstyle
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, QTimer
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (QApplication, QWidget, QLineEdit, QPushButton, QFileDialog,
-                             QDesktopWidget, QDialog)
+                             QDesktopWidget, QDialog, QProgressBar)
 from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtWidgets import QTableWidgetItem, QTableWidget, QHeaderView, QLabel, QVBoxLayout
-from downloader import Downloader
-
-class MediaViewer(QWidget):
-    def __init__(self, folder_path):
-        super().__init__()
-        self.setStyleSheet(qdarkstyle.load_stylesheet())
-
-        self.setWindowTitle('Media Viewer')
-        self.folder_path = folder_path
-        self.initUI()
+from PyQt5.QtWidgets import QLabel, QVBoxLayout
 
-    def initUI(self):
-        layout = QVBoxLayout()
-
-        # Создание таблицы для отображения медиа файлов
-        self.media_table = QTableWidget()
-        self.media_table.setColumnCount(1)  # Одна колонка: имя файла
-        self.media_table.setHorizontalHeaderLabels(['File Name'])
-        self.media_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        layout.addWidget(self.media_table)
-
-        self.load_files()
-        self.setLayout(layout)
-
-    def load_files(self):
-        self.load_from_directory(self.folder_path)
-
-    def load_from_directory(self, directory):
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                item = QTableWidgetItem(file)
-                self.media_table.setRowCount(self.media_table.rowCount() + 1)
-                self.media_table.setItem(self.media_table.rowCount() - 1, 0, item)
-                item.setData(0, file_path)
-
-        self.media_table.cellDoubleClicked.connect(self.open_media)
-
-    def open_media(self, row, column):
-        file_path = self.media_table.item(row, 0).data(0)
-        webbrowser.open(file_path)
+# download_worker (requests, aiohttp, apiDownloader) и media_viewer импортируются
+# при первой загрузке и при первом открытии просмотра, а не при запуске
+MEASURE_STARTUP_FLAG = '--measure-startup'
 
 class SettingsDialog(QDialog):
     def __init__(self, default_download_path, default_threads, default_log_file, parent=None):
@@ -105,11 +72,17 @@ class SettingsDialog(QDialog):
         self.setLayout(layout)
 
     def saveSettings(self):
-        settings = {
+        # Остальные ключи (например, bandwidth) редактируются вручную, их сохраняем как есть
+        try:
+            with open('settings.json', 'r') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            settings = {}
+        settings.update({
             'download_path': self.defaultPathInput.text(),
             'threads': int(self.threadsInput.text()),
             'log_file': self.logFileInput.text()
-        }
+        })
         try:
             with open('settings.json', 'w') as f:
                 json.dump(settings, f)
@@ -130,17 +103,22 @@ class SettingsDialog(QDialog):
 class DownloaderApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.setStyleSheet(qdarkstyle.load_stylesheet())
 
         self.setWindowTitle('Downloader')
         self.setWindowIcon(QIcon('ico.svg'))
         self.default_download_path = os.path.expanduser("~")  # Путь по умолчанию - домашняя директория пользователя
         self.default_threads = 5
         self.default_log_file = 'log.log'
-        self.loadSettings()
+        self.bandwidth = None
+        self.postprocess = False
+        # settings.json читается при первом обращении к настройкам, а не до показа окна
+        self.settings_loaded = False
         self.media_viewer = None
-        self.initUI()
+        self.download_thread = None
+        self.download_worker = None
         self.links = []
+        self.linkLabels = {}
+        self.initUI()
 
         # Центрирование окна
         self.center()
@@ -206,6 +184,19 @@ class DownloaderApp(QWidget):
         self.statusLabel.setStyleSheet(self.get_common_stylesheet())
         layout.addWidget(self.statusLabel, alignment=Qt.AlignCenter)
 
+        # Общий прогресс загрузки
+        self.progressBar = QProgressBar()
+        self.progressBar.setMaximumWidth(1280)
+        self.progressBar.setMaximumHeight(50)
+        self.progressBar.setStyleSheet(self.get_common_stylesheet())
+        layout.addWidget(self.progressBar, alignment=Qt.AlignCenter)
+
+        self.speedLabel = QLabel('')
+        self.speedLabel.setMaximumWidth(1280)
+        self.speedLabel.setMaximumHeight(50)
+        self.speedLabel.setStyleSheet(self.get_common_stylesheet())
+        layout.addWidget(self.speedLabel, alignment=Qt.AlignCenter)
+
         # Кнопка просмотра медиа файлов
         self.viewMediaButton = QPushButton('Просмотреть медиа')
         self.viewMediaButton.setMaximumWidth(1280)
@@ -224,6 +215,7 @@ class DownloaderApp(QWidget):
         self.setLayout(layout)
 
     def open_settings(self):
+        self.ensureSettings()
         try:
             settings_dialog = SettingsDialog(self.default_download_path, self.default_threads, self.default_log_file,
                                              self)
@@ -235,6 +227,11 @@ class DownloaderApp(QWidget):
             self.default_threads = int(settings_dialog.threadsInput.text())
             self.default_log_file = settings_dialog.logFileInput.text()
 
+    def ensureSettings(self):
+        if not self.settings_loaded:
+            self.settings_loaded = True
+            self.loadSettings()
+
     def loadSettings(self):
         try:
             with open('settings.json', 'r') as f:
@@ -242,6 +239,8 @@ class DownloaderApp(QWidget):
                 self.default_download_path = settings.get('download_path', os.path.expanduser("~"))
                 self.default_threads = settings.get('threads', 5)
                 self.default_log_file = settings.get('log_file', 'download.log')
+                self.bandwidth = settings.get('bandwidth')
+                self.postprocess = settings.get('postprocess', False)
         except Exception as e:
             QMessageBox.warning(self, 'Ошибка', f'Не удалось загрузить настройки из файла: {str(e)}')
 
@@ -275,12 +274,14 @@ class DownloaderApp(QWidget):
             if widget:
                 widget.setParent(None)
 
+        self.linkLabels = {}
         for link in self.links:
             label = QLabel(link)
             label.setMaximumWidth(1280)
             label.setMaximumHeight(50)
             label.setStyleSheet(self.get_common_stylesheet())
             self.linksLayout.addWidget(label, alignment=Qt.AlignCenter)
+            self.linkLabels[link] = label
 
     def selectOutputPath(self):
         outputPath = QFileDialog.getExistingDirectory(self, 'Выберите папку')
@@ -291,21 +292,72 @@ class DownloaderApp(QWidget):
         if not self.links:
             self.statusLabel.setText('Пожалуйста, добавьте ссылки.')
             return
-
+        if self.download_thread is not None:
+            self.statusLabel.setText('Загрузка уже идёт.')
+            return
 
         self.statusLabel.setText('Загрузка начата...')
-        self.download_thread = threading.Thread(target=self.downloadFiles, args=(self.links,))
-        self.download_thread.start()
+        self.progressBar.setValue(0)
+        self.startButton.setEnabled(False)
+        self.downloadFiles(list(self.links))
 
     def downloadFiles(self, urls):
-        downloader = Downloader(urls, self.default_download_path, self.statusLabel)
-        downloader.start_download()
+        # Загрузка идёт в QThread, виджеты обновляются только из сигналов в потоке GUI
+        from download_worker import DownloadWorker
+
+        self.ensureSettings()
+        output_path = os.path.join(self.outputPathInput.text() or self.default_download_path, '')
+        self.download_thread = QThread(self)
+        self.download_worker = DownloadWorker(urls, output_path, self.default_threads, self.default_log_file,
+                                              bandwidth=self.bandwidth, postprocess=self.postprocess)
+        self.download_worker.moveToThread(self.download_thread)
+        self.download_thread.started.connect(self.download_worker.run)
+        self.download_worker.progress.connect(self.onProgress)
+        self.download_worker.finished.connect(self.download_thread.quit)
+        self.download_worker.finished.connect(self.download_worker.deleteLater)
+        self.download_thread.finished.connect(self.onDownloadFinished)
+        self.download_thread.start()
+
+    def onProgress(self, progress):
+        if progress['files_total']:
+            self.progressBar.setValue(int(progress['files_done'] / progress['files_total'] * 100))
+        if progress['message']:
+            self.statusLabel.setText(progress['message'])
+        self.speedLabel.setText(f"{progress['files_done']}/{progress['files_total']} файлов, "
+                                f"{progress['bytes_per_sec'] / 1024 / 1024:.2f} МБ/с")
+        for url, (done, total) in progress['threads'].items():
+            label = self.linkLabels.get(url)
+            if label:
+                label.setText(f'{url} — {done}/{total}')
+
+    def closeEvent(self, event):
+        # Закрытие окна во время загрузки: останавливаем её и ждём поток,
+        # иначе Qt уничтожит работающий QThread вместе с процессом.
+        # quit() вызывается здесь, а не по сигналу finished: пока мы ждём,
+        # поток GUI не обрабатывает сигналы
+        if self.download_thread is not None and self.download_thread.isRunning():
+            if self.download_worker is not None:
+                self.download_worker.stop()
+            self.download_thread.quit()
+            self.download_thread.wait()
+        super().closeEvent(event)
+
+    def onDownloadFinished(self):
+        self.download_thread.deleteLater()
+        self.download_thread = None
+        self.download_worker = None
+        self.startButton.setEnabled(True)
+        self.statusLabel.setText('Загрузка завершена.')
 
     def selectDefaultPathFromSettings(self):
+        self.ensureSettings()
         self.outputPathInput.setText(self.default_download_path)
+
     def open_media_viewer(self):
         folder_path = self.outputPathInput.text()
         if os.path.isdir(folder_path):
+            from media_viewer import MediaViewer
+
             self.media_viewer = MediaViewer(folder_path)
             self.media_viewer.show()
         else:
@@ -313,8 +365,29 @@ class DownloaderApp(QWidget):
 
 
 
-if __name__ == "__main__":
-    app = QApplication([])
+def report_startup(app):
+    # Вызывается первой итерацией цикла событий, когда окно уже показано
+    # (только с флагом --measure-startup): время печатается в stdout и
+    # приложение закрывается, так benchmarks/startup.py отслеживает холодный старт
+    elapsed = (time.perf_counter() - STARTUP_STARTED) * 1000
+    print(f'startup_ms {elapsed:.1f}')
+    app.quit()
+
+
+def main():
+    app = QApplication(sys.argv)
+    # Тёмная тема загружается один раз и наследуется всеми окнами, включая MediaViewer
+    app.setStyleSheet(qdarkstyle.load_stylesheet())
     downloader_app = DownloaderApp()
     downloader_app.show()
-    app.exec_()
+    if MEASURE_STARTUP_FLAG in sys.argv:
+        QTimer.singleShot(0, lambda: report_startup(app))
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    # Постобработка запускает процессы через spawn; в сборке PyInstaller они стартуют с этой точки
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+    sys.exit(main())